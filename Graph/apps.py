@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class GraphConfig(AppConfig):
     name = 'Graph'
+
+    def ready(self):
+        import Graph.cache  # connects the tile cache invalidation signals
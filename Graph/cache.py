@@ -0,0 +1,75 @@
+"""
+Server side cache of summarized graph tiles.  Many users request the same region of the same
+GraphGenome at the same summarization level, so the rendered window is stored in Django's cache
+framework under a key of (graph id, summarization level, window).
+
+Invalidation works through GraphGenome.version, which is part of every tile key.  Any change to
+a GraphGenome's Nodes, Paths or NodeTraversals increments the version in the database, which
+orphans all of that graph's tiles at once in every process, whichever process or management
+command made the change and whichever cache backend holds the tiles.  Orphans are never read
+again and fall off the end of the LRU.
+"""
+import hashlib
+
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from Graph.models import GraphGenome, Node, Path, NodeTraversal
+
+TILE_CACHE = 'tiles'  # alias in settings.CACHES
+DERIVED_FIELDS = {'coordinates_blob', 'step_count'}  # saving only these does not change graph content
+
+
+def tiles():
+    return caches[TILE_CACHE]
+
+
+def graph_generation(graph_id):
+    """Token identifying the current content of a graph, None if the graph does not exist.
+    Read from the database, so every process sees changes made by any other."""
+    return GraphGenome.objects.filter(pk=graph_id).values_list('version', flat=True).first()
+
+
+def invalidate_graph(graph_id) -> None:
+    """Orphans every cached tile of this graph.  Signals call this on each save() and delete().
+    Code that writes with bulk_create() or update() bypasses signals and must call it directly."""
+    GraphGenome.objects.filter(pk=graph_id).update(version=F('version') + 1)
+
+
+def tile_key(graph_id, zoom, window) -> str:
+    """:param window: hashable description of the window, e.g. the query parameters"""
+    description = f"{graph_id}:v{graph_generation(graph_id)}:{zoom}:{window!r}"
+    return "tile:" + hashlib.sha1(description.encode()).hexdigest()
+
+
+def cached_tile(graph_id, zoom, window, build):
+    """Returns the cached tile or calls build() and caches the result."""
+    key = tile_key(graph_id, zoom, window)
+    tile = tiles().get(key)
+    if tile is None:
+        tile = build()
+        tiles().set(key, tile)
+    return tile
+
+
+@receiver([post_save, post_delete], sender=GraphGenome)
+def graph_changed(sender, instance, **kwargs):
+    invalidate_graph(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Node)
+@receiver([post_save, post_delete], sender=Path)
+def member_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and DERIVED_FIELDS.issuperset(update_fields):
+        return
+    invalidate_graph(instance.graph_id)
+
+
+@receiver([post_save, post_delete], sender=NodeTraversal)
+def traversal_changed(sender, instance, **kwargs):
+    if NodeTraversal.path.is_cached(instance):
+        invalidate_graph(instance.path.graph_id)
+    else:  # cascading deletes do not load the Path
+        GraphGenome.objects.filter(path__pk=instance.path_id).update(version=F('version') + 1)
@@ -0,0 +1,67 @@
+"""
+Coordinate index for Paths.  Translates base pair positions along an accession's genome into
+the NodeTraversal (step) that covers them and back again.  This is the basis for any genome
+browser style region query.
+"""
+from typing import Iterable, Tuple
+import numpy as np
+
+
+class CoordinateIndex:
+    """Prefix sum over the sequence length of each step in a Path.
+    offsets[i] is the bp position where step i begins and offsets[-1] is the length of the
+    whole Path.  Lookups are binary searches, so they are O(log n) in the number of steps.
+    Steps are counted by rank in the Path, which is the same as NodeTraversal.order because
+    order is assigned contiguously from 0 on append."""
+    dtype = np.dtype('<i8')  # little endian so the persisted bytes are portable
+
+    def __init__(self, offsets: np.ndarray):
+        self.offsets = offsets
+
+    @classmethod
+    def from_lengths(cls, lengths: Iterable[int]) -> 'CoordinateIndex':
+        lengths = np.fromiter(lengths, dtype=cls.dtype)
+        offsets = np.zeros(len(lengths) + 1, dtype=cls.dtype)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(offsets)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'CoordinateIndex':
+        return cls(np.frombuffer(blob, dtype=cls.dtype))
+
+    def to_bytes(self) -> bytes:
+        return self.offsets.astype(self.dtype, copy=False).tobytes()
+
+    def __len__(self):
+        """Number of steps in the indexed Path"""
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return f"CoordinateIndex({len(self)} steps, {self.length} bp)"
+
+    @property
+    def length(self) -> int:
+        """Total length of the Path in bp"""
+        return int(self.offsets[-1])
+
+    def position_to_step(self, position: int) -> int:
+        """Rank of the step covering bp position.  Zero length steps never cover a position."""
+        if not 0 <= position < self.length:
+            raise IndexError(f"Position {position} is outside of a {self.length} bp Path")
+        return int(np.searchsorted(self.offsets, position, side='right')) - 1
+
+    def step_to_position(self, step: int) -> int:
+        """bp position where the step with this rank begins"""
+        if not 0 <= step < len(self):
+            raise IndexError(f"Step {step} is outside of a {len(self)} step Path")
+        return int(self.offsets[step])
+
+    def step_range(self, start: int, end: int) -> Tuple[int, int]:
+        """Half open range of step ranks overlapping the half open bp range [start, end).
+        Returns an empty range if nothing overlaps."""
+        start, end = max(start, 0), min(end, self.length)
+        if start >= end:
+            return 0, 0
+        first = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        last = int(np.searchsorted(self.offsets, end, side='left'))
+        return first, last
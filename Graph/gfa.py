@@ -1,12 +1,22 @@
 from collections import defaultdict
-from typing import List, NamedTuple
-from itertools import tee
+from typing import Iterator, List, NamedTuple
+from itertools import groupby, islice, tee
 import gfapy
 import subprocess
 import io
 import os
 import tempfile
+from contextlib import nullcontext
+from django.db import connection, transaction
+from Graph.bulk import bulk_load
 from Graph.models import *
+from Graph.sequence import canonical
+
+
+def chunks(items: List, size: int):
+    """Consecutive slices of items with at most size elements each"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
 def pairwise(iterable):
@@ -16,6 +26,42 @@ def pairwise(iterable):
     return zip(a, b)
 
 
+def segment_sequence(segment) -> str:
+    """Sequence of a GFA segment as stored.  The '*' placeholder of a segment without a sequence is
+    stored as an empty sequence, its LN length is not kept."""
+    return '' if gfapy.is_placeholder(segment.sequence) else canonical(str(segment.sequence))
+
+
+def iter_gfa(graph: GraphGenome, zoom: int = 0, chunk_size: int = 2000) -> Iterator[str]:
+    """GFA1 text of one ZoomLevel of graph in pieces of about chunk_size lines or steps, for
+    streaming downloads.  Segments come first, then the links between consecutive steps, then one
+    P line per Path with steps.  Rows are read with database cursors and links are deduplicated by
+    the database, so neither the graph nor a single Path is ever held in memory."""
+    yield 'H\tVN:Z:1.0\n'
+    segments = Node.objects.filter(graph=graph, zoom=zoom).order_by('name').values_list('name', 'packed', 'seq_length')
+    rows = segments.iterator(chunk_size=chunk_size)
+    for batch in iter(lambda: list(islice(rows, chunk_size)), []):
+        yield ''.join(f"S\t{name}\t{PackedSequence(packed, length) if length else '*'}\n"  # '*': no sequence
+                      for name, packed, length in batch)
+    traversals, paths = NodeTraversal._meta.db_table, Path._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT DISTINCT a.node_id, a.strand, b.node_id, b.strand FROM "{traversals}" a '
+                       f'JOIN "{traversals}" b ON b.path_id = a.path_id AND b."order" = a."order" + 1 '
+                       f'JOIN "{paths}" p ON p.id = a.path_id WHERE p.graph_id = %s AND p.zoom = %s '
+                       f'ORDER BY a.node_id, a.strand, b.node_id, b.strand', [graph.pk, zoom])
+        for batch in iter(lambda: cursor.fetchmany(chunk_size), []):
+            yield ''.join(f"L\t{a}\t{strand_a}\t{b}\t{strand_b}\t0M\n" for a, strand_a, b, strand_b in batch)
+    accessions = dict(Path.objects.filter(graph=graph, zoom=zoom).values_list('id', 'accession'))
+    steps = NodeTraversal.objects.filter(path__graph=graph, path__zoom=zoom).order_by('path_id', 'order')
+    for path_id, path_steps in groupby(steps.values_list('path_id', 'node_id', 'strand').iterator(chunk_size=chunk_size),
+                                       key=lambda step: step[0]):
+        separator, count = f"P\t{accessions[path_id]}\t", 0
+        for batch in iter(lambda: list(islice(path_steps, chunk_size)), []):
+            yield separator + ','.join(node_id + strand for _, node_id, strand in batch)
+            separator, count = ',', count + len(batch)
+        yield '\t' + (','.join('*' * (count - 1)) or '*') + '\n'  # one overlap per link
+
+
 class TopologicalSort:
     def __init__(self):
         self.graph = defaultdict(list)  # dictionary containing adjacency List
@@ -110,23 +156,76 @@ class GFA:
             node_series = ",".join([traverse.node.name + traverse.strand for traverse in path.nodes])
             gfa.add_line('\t'.join(['P', path.accession, node_series, ",".join(['*' for _ in path.nodes])]))
         for node in graph.nodes:  # in no particular order
-            gfa.add_line('\t'.join(['S', str(node.name), node.seq]))
+            gfa.add_line('\t'.join(['S', str(node.name), node.seq or '*']))
         return cls(gfa, "from Graph")
 
     def to_paths(self) -> GraphGenome:
         graph = self.to_graph()
         return graph.paths
 
-    def to_graph(self) -> GraphGenome:
+    def fingerprint(self) -> str:
+        """The content fingerprint a GraphGenome built from this GFA will have.
+        See Graph.models.content_hash for the definition."""
+        seqs = {segment.name: segment_sequence(segment) for segment in self.gfa.segments}
+        return self._partial_fingerprint(seqs, seqs, {path.name: len(path.segment_names) for path in self.gfa.paths})
+
+    def _partial_fingerprint(self, seqs: dict, node_names, step_counts: dict) -> str:
+        """Fingerprint of the named Nodes and of the Paths in step_counts with only that many of
+        their first steps, as an interrupted import leaves them"""
+        total = sum(node_item(seqs[name]) for name in node_names)
+        for path in self.gfa.paths:
+            if path.name in step_counts:
+                total += path_item(path.name)
+                total += sum(step_item(path.name, order, seqs[node.name], node.orient)
+                             for order, node in enumerate(path.segment_names[:step_counts[path.name]]))
+        return combine_fingerprint(EMPTY_FINGERPRINT, total)
+
+    def to_graph(self, batch_size: int = 10000, bulk: bool = False) -> GraphGenome:
         """Create parent object for this genome and save it in the database.
-        This can create duplicates appended in Paths if it is called twice."""
+        If a GraphGenome with identical content already exists, it is returned instead.
+        Import is idempotent and resumable: the graph is found by name, Nodes by name and Path steps
+        by (Path, order), so only what is missing gets written.  Rows are committed in transactions
+        of batch_size together with their share of the fingerprint, so an interrupted import leaves
+        a consistent prefix that the next call continues from.  Raises ValueError when the graph
+        of that name holds anything but a prefix of this file, for example after the file changed.
+        bulk=True runs the import in Graph.bulk.bulk_load() mode for large files."""
+        duplicate = GraphGenome.objects.filter(fingerprint=self.fingerprint()).exclude(
+            fingerprint=EMPTY_FINGERPRINT).first()
+        if duplicate is not None:
+            return duplicate
+        with bulk_load() if bulk else nullcontext():
+            return self._import(batch_size)
+
+    def _import(self, batch_size: int) -> GraphGenome:
+        from Graph.cache import invalidate_graph
         gdb = GraphGenome.objects.get_or_create(name=self.source_path)[0]
-        for segment in self.gfa.segments:
-            Node.objects.get_or_create(seq=segment.sequence, name=(segment.name), graph=gdb)
+        seqs = {segment.name: segment_sequence(segment) for segment in self.gfa.segments}
+        present = set(gdb.nodes.values_list('name', flat=True))
+        step_counts = dict(gdb.paths.values_list('accession', 'step_count'))
+        lengths = {path.name: len(path.segment_names) for path in self.gfa.paths}
+        if not (present <= seqs.keys() and all(count <= lengths.get(accession, -1)
+                                               for accession, count in step_counts.items()) and
+                gdb.fingerprint == self._partial_fingerprint(seqs, present, step_counts)):
+            raise ValueError(f"Graph {gdb.name} does not match the content of the file, delete it to import again")
+        missing = [Node(seq=seq, name=name, graph=gdb) for name, seq in seqs.items() if name not in present]
+        for batch in chunks(missing, batch_size):
+            with transaction.atomic():
+                Node.objects.bulk_create(batch)
+                GraphGenome.add_to_fingerprint(gdb.pk, sum(node_item(node.seq) for node in batch))
 
         for path in self.gfa.paths:
-            p = Path(accession=path.name, graph=gdb)
-            p.save()
-            p.append_gfa_nodes(path.segment_names)
+            p = gdb.paths.filter(accession=path.name).first()
+            if p is None:
+                p = Path(accession=path.name, graph=gdb)
+                p.save()  # atomic with its fingerprint
+            done = p.step_count  # progress of this Path, committed together with each batch
+            for start in range(done, len(path.segment_names), batch_size):
+                batch = [NodeTraversal(node_id=node.name, path=p, strand=node.orient, order=order)
+                         for order, node in enumerate(path.segment_names[start:start + batch_size], start)]
+                with transaction.atomic():
+                    NodeTraversal.objects.bulk_create(batch, force=True)
+                    Path.objects.filter(pk=p.pk).update(step_count=start + len(batch))
+                    GraphGenome.add_to_fingerprint(gdb.pk, sum(
+                        step_item(p.accession, t.order, seqs[t.node_id], t.strand) for t in batch))
+        invalidate_graph(gdb.pk)
         return gdb
-
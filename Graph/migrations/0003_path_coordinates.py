@@ -0,0 +1,18 @@
+# Generated by Django 2.2.1 on 2026-10-19 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Graph', '0002_Path_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='path',
+            name='coordinates_blob',
+            field=models.BinaryField(help_text='Persisted CoordinateIndex, see Path.coordinates', null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.1 on 2026-10-19 04:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Graph', '0003_path_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='summarized_by',
+            field=models.ForeignKey(blank=True, help_text='Node in the next coarser ZoomLevel covering this Node', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='Graph.Node'),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='zoom',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Summarization layer, see ZoomLevel'),
+        ),
+        migrations.AddField(
+            model_name='path',
+            name='zoom',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Summarization layer, see ZoomLevel'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='path',
+            unique_together={('graph', 'accession', 'zoom')},
+        ),
+        migrations.CreateModel(
+            name='ZoomLevel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField(help_text='0 is full resolution, larger is coarser')),
+                ('description', models.CharField(blank=True, max_length=1000)),
+                ('graph', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Graph.GraphGenome')),
+            ],
+            options={
+                'unique_together': {('graph', 'zoom')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.1 on 2026-10-19 04:03
+
+import hashlib
+
+from django.db import migrations, models
+
+# Frozen copy of the fingerprint definition in Graph.models at the time of this migration
+FINGERPRINT_MODULUS = 2 ** 256
+
+
+def content_hash(*parts) -> int:
+    return int.from_bytes(hashlib.sha256('\t'.join(str(p) for p in parts).encode()).digest(), 'big')
+
+
+def fingerprint_existing_graphs(apps, schema_editor):
+    GraphGenome = apps.get_model('Graph', 'GraphGenome')
+    Node = apps.get_model('Graph', 'Node')
+    Path = apps.get_model('Graph', 'Path')
+    NodeTraversal = apps.get_model('Graph', 'NodeTraversal')
+    for graph in GraphGenome.objects.all():
+        total = sum(content_hash('S', seq) for seq in
+                    Node.objects.filter(graph=graph, zoom=0).values_list('seq', flat=True))
+        total += sum(content_hash('P', accession) for accession in
+                     Path.objects.filter(graph=graph, zoom=0).values_list('accession', flat=True))
+        total += sum(content_hash('T', *values) for values in
+                     NodeTraversal.objects.filter(path__graph=graph, path__zoom=0)
+                     .values_list('path__accession', 'order', 'node__seq', 'strand'))
+        graph.fingerprint = format(total % FINGERPRINT_MODULUS, '064x')
+        graph.save(update_fields=['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Graph', '0004_zoom_levels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphgenome',
+            name='fingerprint',
+            field=models.CharField(db_index=True, default='0000000000000000000000000000000000000000000000000000000000000000', editable=False, help_text='Hash of the full resolution content, updated on insert.  Call rebuild_fingerprint() after deleting or editing.', max_length=64),
+        ),
+        migrations.RunPython(fingerprint_existing_graphs, migrations.RunPython.noop),
+    ]
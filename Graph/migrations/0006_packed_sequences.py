@@ -0,0 +1,101 @@
+# Generated by Django 2.2.1 on 2026-10-19 04:05
+
+import hashlib
+
+from django.db import migrations, models
+
+# Frozen copy of the packing in Graph.sequence and of the fingerprint definition in Graph.models at
+# the time of this migration
+TWO_BIT_ALPHABET = b'ACGT'
+FOUR_BIT_ALPHABET = b'-ACMGRSVTWYHKDBN'
+FINGERPRINT_MODULUS = 2 ** 256
+
+
+def pack(seq: str):
+    """Packed bytes and length of seq.  '*' is the GFA placeholder for no sequence."""
+    seq = '' if seq == '*' else seq.upper().replace('U', 'T')
+    bits = 2 if set(seq) <= set('ACGT') else 4
+    alphabet = TWO_BIT_ALPHABET if bits == 2 else FOUR_BIT_ALPHABET
+    codes = []
+    for char in seq.encode('ascii'):
+        if char not in alphabet:
+            raise ValueError(f"{chr(char)!r} is not a nucleotide or IUPAC code")
+        codes.append(alphabet.index(char))
+    per_byte = 8 // bits
+    data = bytearray([bits])
+    for start in range(0, len(codes), per_byte):
+        data.append(sum(code << (8 - bits * (i + 1)) for i, code in enumerate(codes[start:start + per_byte])))
+    return bytes(data), len(codes)
+
+
+def unpack(data: bytes, length: int) -> str:
+    bits = data[0] if data else 2
+    alphabet = TWO_BIT_ALPHABET if bits == 2 else FOUR_BIT_ALPHABET
+    per_byte = 8 // bits
+    return bytes(alphabet[data[1 + i // per_byte] >> (8 - bits * (i % per_byte + 1)) & ((1 << bits) - 1)]
+                 for i in range(length)).decode('ascii')
+
+
+def content_hash(*parts) -> int:
+    return int.from_bytes(hashlib.sha256('\t'.join(str(p) for p in parts).encode()).digest(), 'big')
+
+
+def fingerprint(graph, seqs, Path, NodeTraversal) -> str:
+    """Fingerprint of the full resolution layer of graph given the sequences of its Nodes by name"""
+    total = sum(content_hash('S', seq) for seq in seqs.values())
+    total += sum(content_hash('P', accession) for accession in
+                 Path.objects.filter(graph=graph, zoom=0).values_list('accession', flat=True))
+    total += sum(content_hash('T', accession, order, seqs[node_id], strand) for accession, order, node_id, strand in
+                 NodeTraversal.objects.filter(path__graph=graph, path__zoom=0)
+                 .values_list('path__accession', 'order', 'node_id', 'strand').iterator())
+    return format(total % FINGERPRINT_MODULUS, '064x')
+
+
+def pack_sequences(apps, schema_editor):
+    """Packs every sequence and refingerprints each graph, since the fingerprints of migration 0005
+    hashed the sequences before packing made them upper case with U read as T"""
+    GraphGenome = apps.get_model('Graph', 'GraphGenome')
+    Node = apps.get_model('Graph', 'Node')
+    Path = apps.get_model('Graph', 'Path')
+    NodeTraversal = apps.get_model('Graph', 'NodeTraversal')
+    for graph in GraphGenome.objects.all():
+        seqs = {}
+        for node in Node.objects.filter(graph=graph).iterator():
+            node.packed, node.seq_length = pack(node.seq)
+            node.save(update_fields=['packed', 'seq_length'])
+            if node.zoom == 0:
+                seqs[node.name] = unpack(node.packed, node.seq_length)
+        graph.fingerprint = fingerprint(graph, seqs, Path, NodeTraversal)
+        graph.save(update_fields=['fingerprint'])
+
+
+def unpack_sequences(apps, schema_editor):
+    Node = apps.get_model('Graph', 'Node')
+    for node in Node.objects.all().iterator():
+        node.seq = unpack(node.packed, node.seq_length)
+        node.save(update_fields=['seq'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Graph', '0005_graph_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='packed',
+            field=models.BinaryField(default=bytes, help_text='PackedSequence, see Graph.sequence'),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='seq_length',
+            field=models.PositiveIntegerField(default=0, help_text='Length of the sequence in bp'),
+        ),
+        migrations.RunPython(pack_sequences, unpack_sequences),
+        migrations.RemoveField(
+            model_name='node',
+            name='seq',
+        ),
+    ]
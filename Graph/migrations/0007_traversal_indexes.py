@@ -0,0 +1,47 @@
+# Generated by Django 2.2.1 on 2026-10-19 04:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Coalesce
+
+
+def count_steps(apps, schema_editor):
+    """step_count is the next free order, which is past the last step even if orders have gaps"""
+    Path = apps.get_model('Graph', 'Path')
+    NodeTraversal = apps.get_model('Graph', 'NodeTraversal')
+    last = NodeTraversal.objects.filter(path=models.OuterRef('pk')).order_by('-order').values('order')[:1]
+    Path.objects.update(step_count=Coalesce(models.Subquery(last) + 1, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Graph', '0006_packed_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='path',
+            name='step_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of NodeTraversals, also the next free order'),
+        ),
+        migrations.RunPython(count_steps, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='nodetraversal',
+            name='node',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Graph.Node'),
+        ),
+        migrations.AlterField(
+            model_name='nodetraversal',
+            name='path',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Graph.Path'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodetraversal',
+            unique_together={('path', 'order')},
+        ),
+        migrations.AddIndex(
+            model_name='nodetraversal',
+            index=models.Index(fields=['node', 'path'], name='Graph_nodet_node_id_6f8ad2_idx'),
+        ),
+    ]
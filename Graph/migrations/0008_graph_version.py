@@ -0,0 +1,18 @@
+# Generated by Django 2.2.1 on 2026-10-19 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Graph', '0007_traversal_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphgenome',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Incremented on every change, identifies cached tiles.  See Graph.cache'),
+        ),
+    ]
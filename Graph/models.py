@@ -1,5 +1,10 @@
-from typing import List, Iterable
-from django.db import models
+from itertools import islice
+from typing import List, Iterable, Iterator, TextIO, Tuple
+import hashlib
+import numpy as np
+from django.db import models, transaction
+from Graph.coordinates import CoordinateIndex
+from Graph.sequence import PackedSequence
 from Utils.models import CustomSaveManager
 
 
@@ -14,29 +19,102 @@ class NodeMissingError(ValueError):
     pass
 
 
+# Content fingerprints are a multiset hash: the sum modulo 2**256 of the sha256 of every item in
+# the graph.  Sums do not depend on insertion order, so adding an item is O(1) and two graphs with
+# the same content have the same fingerprint no matter how they were built.
+FINGERPRINT_MODULUS = 2 ** 256
+EMPTY_FINGERPRINT = '0' * 64
+
+
+def content_hash(*parts) -> int:
+    return int.from_bytes(hashlib.sha256('\t'.join(str(p) for p in parts).encode()).digest(), 'big')
+
+
+def node_item(seq: str) -> int:
+    """Nodes are identified by sequence only so that node names do not affect equality."""
+    return content_hash('S', seq)
+
+
+def path_item(accession: str) -> int:
+    return content_hash('P', accession)
+
+
+def step_item(accession: str, order: int, seq: str, strand: str) -> int:
+    return content_hash('T', accession, order, seq, strand)
+
+
+def combine_fingerprint(fingerprint: str, delta: int) -> str:
+    return format((int(fingerprint, 16) + delta) % FINGERPRINT_MODULUS, '064x')
+
+
 class GraphGenome(models.Model):
     name = models.CharField(max_length=1000)
+    fingerprint = models.CharField(max_length=64, default=EMPTY_FINGERPRINT, db_index=True, editable=False,
+                                   help_text='Hash of the full resolution content, updated on insert.  '
+                                             'Call rebuild_fingerprint() after deleting or editing.')
+    version = models.PositiveIntegerField(default=0, editable=False,
+                                          help_text='Incremented on every change, identifies cached tiles.  See Graph.cache')
 
     @property
     def paths(self):
-        """Getter only.  Shortcut for DB."""
-        return self.path_set.all()
+        """Getter only.  Shortcut for DB.  Full resolution Paths, see ZoomLevel for summaries."""
+        return self.path_set.filter(zoom=0)
 
     @property
     def nodes(self):
-        """Getter only.  Shortcut for DB."""
-        return self.node_set.all()
+        """Getter only.  Shortcut for DB.  Full resolution Nodes, see ZoomLevel for summaries."""
+        return self.node_set.filter(zoom=0)
 
     def __repr__(self):
         """Warning: the representation strings are very sensitive to whitespace"""
-        return f"Graph: {self.name}\n{self.path_set.count()} paths  {self.node_set.count()} nodes."
+        return f"Graph: {self.name}\n{self.paths.count()} paths  {self.nodes.count()} nodes."
 
     def __eq__(self, other):
+        """Graphs are equal when they have the same node sequences and every accession spells
+        the same steps.  Names are ignored.  Compares persisted fingerprints in one query."""
         if isinstance(other, GraphGenome):
-            return other.node_set.count() == self.node_set.count() and \
-                   other.path_set.count() == self.path_set.count()  # other.name == self.name and \
+            if self.pk is None or other.pk is None:  # unsaved, nothing to compare yet
+                return self is other
+            if self.pk == other.pk:
+                return True
+            fingerprints = GraphGenome.objects.filter(pk__in=[self.pk, other.pk]).values_list('fingerprint', flat=True)
+            return len(set(fingerprints)) == 1
         return False
 
+    def __hash__(self):
+        return super(GraphGenome, self).__hash__()
+
+    @classmethod
+    def add_to_fingerprint(cls, graph_id, delta: int) -> None:
+        """Folds the hash of newly inserted items into the persisted fingerprint.  Bulk writers
+        should sum the items of a whole batch and call this once."""
+        with transaction.atomic():
+            current = cls.objects.select_for_update().values_list('fingerprint', flat=True).get(pk=graph_id)
+            cls.objects.filter(pk=graph_id).update(fingerprint=combine_fingerprint(current, delta))
+
+    def rebuild_fingerprint(self) -> str:
+        """Recalculates the fingerprint from scratch."""
+        total = sum(node_item(str(PackedSequence(packed, length))) for packed, length in
+                    self.nodes.values_list('packed', 'seq_length').iterator())
+        total += sum(path_item(accession) for accession in self.paths.values_list('accession', flat=True))
+        seqs = {name: str(PackedSequence(packed, length)) for name, packed, length in
+                self.nodes.values_list('name', 'packed', 'seq_length').iterator()}
+        total += sum(step_item(accession, order, seqs[node_id], strand) for accession, order, node_id, strand in
+                     NodeTraversal.objects.filter(path__graph=self, path__zoom=0)
+                     .values_list('path__accession', 'order', 'node_id', 'strand').iterator())
+        self.fingerprint = combine_fingerprint(EMPTY_FINGERPRINT, total)
+        GraphGenome.objects.filter(pk=self.pk).update(fingerprint=self.fingerprint)
+        return self.fingerprint
+
+    def zoom_level(self, zoom: int) -> 'ZoomLevel':
+        """Summarization layer of this graph, created if necessary."""
+        return ZoomLevel.objects.get_or_create(graph=self, zoom=zoom)[0]
+
+    def working(self, zoom: int = 0) -> 'WorkingGraph':
+        """In-memory copy of a ZoomLevel for algorithms, see Graph.working"""
+        from Graph.working import WorkingGraph
+        return WorkingGraph.load(self, zoom)
+
     @classmethod
     def load_from_xg(cls, file: str, xg_bin: str) -> 'GraphGenome':
         """XG is a graph format used by VG (variation graph).  This method builds a
@@ -54,21 +132,83 @@ class GraphGenome(models.Model):
 
     def append_node_to_path(self, node_id, strand, path_name) -> None:
         """This is the preferred way to build a graph in a truly non-linear way.
-        Nodes will be created if necessary.
-        NodeTraversal is appended to Path (order dependent) and PathIndex is added to Node
-        (order independent)."""
-        if node_id not in self.nodes:  # hasn't been created yet, need to retrieve from dictionary of guid
-            if isinstance(node_id, str):
-                self.nodes[node_id] = Node('', [], node_id)
-            else:
-                raise ValueError("Provide the id of the node, not", node_id)
-        Path.objects.get(name=path_name).append_node(Node.objects.get(name=node_id), strand)
+        The Node is created without sequence if this graph does not have it yet.
+        NodeTraversal is appended to the full resolution Path with accession path_name.
+        Use Path.append_nodes() to append many steps at once."""
+        if not isinstance(node_id, str):
+            raise ValueError("Provide the id of the node, not", node_id)
+        Node.objects.get_or_create(name=node_id, graph=self, defaults={'seq': ''})
+        self.paths.get(accession=path_name).append_nodes([(node_id, strand)])
+
+
+class ZoomLevel(models.Model):
+    """Summarization layer of a GraphGenome.  Zoom 0 is the full resolution graph built from GFA.
+    Each coarser layer has its own summary Nodes, each of which lists the Nodes of the next finer
+    layer that it covers as Node.children.  Every accession also has a Path at each layer that
+    traverses the summary Nodes.  A browser loads a coarse layer for zoomed out views, which is
+    orders of magnitude fewer rows, and refines to finer layers as the user zooms in."""
+    graph = models.ForeignKey(GraphGenome, on_delete=models.CASCADE)
+    zoom = models.PositiveSmallIntegerField(help_text='0 is full resolution, larger is coarser')
+    description = models.CharField(max_length=1000, blank=True)
+
+    class Meta:
+        unique_together = ['graph', 'zoom']
+
+    def __repr__(self):
+        return f"ZoomLevel {self.zoom} of {self.graph.name}"
+
+    @property
+    def paths(self):
+        return self.graph.path_set.filter(zoom=self.zoom)
+
+    @property
+    def nodes(self):
+        return self.graph.node_set.filter(zoom=self.zoom)
+
+    def add_summary_node(self, name: str, children: Iterable['Node'], seq: str = '') -> 'Node':
+        """Creates a Node in this layer that summarizes children from the next finer layer."""
+        node = Node(seq=seq, name=name, graph=self.graph, zoom=self.zoom)
+        node.save()
+        Node.objects.filter(graph=self.graph, zoom=self.zoom - 1,
+                            name__in=[child.name for child in children]).update(summarized_by=node)
+        return node
+
+    def build_paths(self) -> None:
+        """Derives the Paths of this layer from the next finer layer.  Each finer step is replaced
+        by the summary Node that covers it; consecutive steps in the same summary collapse into one.
+        Finer Nodes without a summary are left out.  Coordinates of summary Paths are kept in bp
+        of the finer Path so region queries work at every layer."""
+        from Graph.cache import invalidate_graph
+        self.paths.delete()
+        for finer in self.graph.path_set.filter(zoom=self.zoom - 1):
+            path = Path(accession=finer.accession, graph=self.graph, zoom=self.zoom)
+            path.save()
+            traversals, offsets = [], []
+            finer_offsets = finer.coordinates.offsets
+            previous = None
+            for order, (summary, strand) in enumerate(finer.nodes.values_list('node__summarized_by', 'strand')):
+                if summary is not None and summary != previous:
+                    traversals.append(NodeTraversal(node_id=summary, path=path, strand=strand,
+                                                    order=len(traversals)))
+                    offsets.append(finer_offsets[order])
+                previous = summary
+            NodeTraversal.objects.bulk_create(traversals, force=True)
+            offsets.append(finer_offsets[-1])
+            path.coordinates_blob = CoordinateIndex(np.array(offsets, dtype=CoordinateIndex.dtype)).to_bytes()
+            path.step_count = len(traversals)
+            path.save(update_fields=['coordinates_blob', 'step_count'])
+        invalidate_graph(self.graph_id)
 
 
 class Node(models.Model):
-    seq = models.CharField(max_length=255, blank=True)
+    packed = models.BinaryField(default=bytes, editable=False, help_text='PackedSequence, see Graph.sequence')
+    seq_length = models.PositiveIntegerField(default=0, help_text='Length of the sequence in bp')
     name = models.CharField(primary_key=True, max_length=15)
     graph = models.ForeignKey(GraphGenome, on_delete=models.CASCADE)
+    zoom = models.PositiveSmallIntegerField(default=0, help_text='Summarization layer, see ZoomLevel')
+    summarized_by = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL,
+                                      related_name='children',
+                                      help_text='Node in the next coarser ZoomLevel covering this Node')
 
     class Meta:
         unique_together = ['graph', 'name']
@@ -76,6 +216,10 @@ class Node(models.Model):
     def __len__(self):
         return self.nodetraversal_set.count()
 
+    def __bool__(self):
+        """Django tests related objects for truth on every save, which would otherwise count traversals"""
+        return True
+
     # def __repr__(self):
     #     """Paths representation is sorted because set ordering is not guaranteed."""
     #     return repr(self.seq) + \
@@ -88,7 +232,31 @@ class Node(models.Model):
     #     return self.seq == other.seq and self.paths == other.paths  # and self.id == other.id
 
     def __hash__(self):
-        return (hash(self.seq) + 1) * hash(self.name)
+        return (hash(bytes(self.packed)) + 1) * hash(self.name)
+
+    @property
+    def sequence(self) -> PackedSequence:
+        return PackedSequence.from_bytes(self.packed, self.seq_length)
+
+    @property
+    def seq(self) -> str:
+        """Sequence decoded from packed storage.  Accepted as a keyword like a field: Node(seq='ACGT')"""
+        return str(self.sequence)
+
+    @seq.setter
+    def seq(self, value: str):
+        self.sequence = PackedSequence.pack(value)
+
+    @sequence.setter
+    def sequence(self, value: PackedSequence):
+        self.packed, self.seq_length = value.to_bytes(), len(value)
+
+    def save(self, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super(Node, self).save(**kwargs)
+            if adding and self.zoom == 0:
+                GraphGenome.add_to_fingerprint(self.graph_id, node_item(self.seq))
 
     def to_gfa(self, segment_id: int):
         return '\t'.join(['S', str(segment_id), self.seq])
@@ -99,11 +267,16 @@ class Path(models.Model):
     was sequenced.  A path visits a series of nodes and the ordered concatenation of the node
     sequences is the accession's genome.  Create Paths first from accession names, then append
     them to Nodes to link together."""
-    accession = models.CharField(max_length=1000)  # one path per accession
+    accession = models.CharField(max_length=1000)  # one path per accession and ZoomLevel
     graph = models.ForeignKey(GraphGenome, on_delete=models.CASCADE)
+    zoom = models.PositiveSmallIntegerField(default=0, help_text='Summarization layer, see ZoomLevel')
+    coordinates_blob = models.BinaryField(null=True, editable=False,
+                                          help_text='Persisted CoordinateIndex, see Path.coordinates')
+    step_count = models.PositiveIntegerField(default=0, editable=False,
+                                             help_text='Number of NodeTraversals, also the next free order')
 
     class Meta:
-        unique_together = ['graph', 'accession']
+        unique_together = ['graph', 'accession', 'zoom']
 
     def __getitem__(self, path_index):
         return self.nodes[path_index]
@@ -118,21 +291,53 @@ class Path(models.Model):
     def __hash__(self):
         return hash(self.accession)
 
+    def save(self, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super(Path, self).save(**kwargs)
+            if adding and self.zoom == 0:
+                GraphGenome.add_to_fingerprint(self.graph_id, path_item(self.accession))
+
     @property
     def nodes(self) -> Iterable['NodeTraversal']:
         return NodeTraversal.objects.filter(path=self).order_by('order').all()
 
     def append_gfa_nodes(self, nodes):
         assert hasattr(nodes[0], 'orient') and hasattr(nodes[0], 'name'), 'Expecting gfapy.Gfa.path'
-        for node in nodes:
-            NodeTraversal(node=Node.objects.get(name=node.name),
-                          path=self, strand=node.orient).save()
+        self.append_nodes([(node.name, node.orient) for node in nodes])
 
     def append_node(self, node: Node, strand: str):
         """This is the preferred way to build a graph in a truly non-linear way.
         NodeTraversal is appended to Path (order dependent) and PathIndex is added to Node (order independent)."""
         NodeTraversal(node=node, path=self, strand=strand).save()
 
+    def append_nodes(self, steps: Iterable[Tuple[str, str]], batch_size: int = 10000) -> int:
+        """Appends (node name, strand) steps to the end of this Path and returns the new step count.
+        Names are resolved among the Nodes of this Path's graph and ZoomLevel with one query per
+        batch, and each batch is written with one insert in a transaction together with step_count
+        and its share of the fingerprint.  Raises NodeMissingError before writing a batch that
+        names an unknown Node."""
+        from Graph.cache import invalidate_graph
+        steps = iter(steps)
+        for batch in iter(lambda: list(islice(steps, batch_size)), []):
+            nodes = Node.objects.filter(graph_id=self.graph_id, zoom=self.zoom).in_bulk({name for name, _ in batch})
+            missing = [name for name, _ in batch if name not in nodes]
+            if missing:
+                raise NodeMissingError(f"Graph {self.graph_id} has no Nodes {missing[:10]}")
+            with transaction.atomic():
+                start = Path.objects.select_for_update().values_list('step_count', flat=True).get(pk=self.pk)
+                NodeTraversal.objects.bulk_create(
+                    [NodeTraversal(node_id=name, path_id=self.pk, strand=strand, order=order)
+                     for order, (name, strand) in enumerate(batch, start)], force=True)
+                self.step_count = start + len(batch)
+                Path.objects.filter(pk=self.pk).update(step_count=self.step_count)
+                if self.zoom == 0:
+                    GraphGenome.add_to_fingerprint(self.graph_id, sum(
+                        step_item(self.accession, order, nodes[name].seq, strand)
+                        for order, (name, strand) in enumerate(batch, start)))
+            invalidate_graph(self.graph_id)  # bulk_create sends no signals
+        return self.step_count
+
     # @classmethod
     # def build(cls, name: str, seq_of_nodes: List[str]):
     #     node = Node.objects.create(seq)
@@ -142,6 +347,88 @@ class Path(models.Model):
     def name(self):
         return self.accession
 
+    @property
+    def coordinates(self) -> CoordinateIndex:
+        """Cumulative bp offsets of every step in this Path.  The persisted index is reused
+        unless the Path has grown since it was built."""
+        if self.coordinates_blob is not None:
+            index = CoordinateIndex.from_bytes(self.coordinates_blob)
+            if len(index) == self.step_count:
+                return index
+        return self.build_coordinate_index()
+
+    def build_coordinate_index(self) -> CoordinateIndex:
+        """Recalculates the prefix sum of step lengths and saves it with the Path.
+        Lengths are stored with each Node so sequences are never transferred."""
+        lengths = self.nodes.values_list('node__seq_length', flat=True)
+        index = CoordinateIndex.from_lengths(lengths)
+        self.coordinates_blob = index.to_bytes()
+        self.save(update_fields=['coordinates_blob'])
+        return index
+
+    def step_at(self, position: int) -> 'NodeTraversal':
+        """The NodeTraversal covering bp position (0 based) of this Path"""
+        return self.nodes.get(order=self.coordinates.position_to_step(position))
+
+    def position_of(self, traversal: 'NodeTraversal') -> int:
+        """bp position (0 based) where traversal begins in this Path"""
+        return self.coordinates.step_to_position(traversal.order)
+
+    def steps_in_range(self, start: int, end: int) -> Iterable['NodeTraversal']:
+        """All NodeTraversals overlapping the bp range [start, end) in Path order"""
+        first, last = self.coordinates.step_range(start, end)
+        return self.nodes.filter(order__gte=first, order__lt=last)
+
+    def iter_sequence(self, start: int = 0, end: int = None, chunk_size: int = 1 << 20) -> Iterator[str]:
+        """Streams the spliced sequence of this Path, or of the bp range [start, end), in chunks of
+        at least chunk_size bp (except the last).  The steps in range are read with one ordered join
+        query and their packed sequences are sliced and reverse complemented without decoding
+        anything outside the range."""
+        index = self.coordinates
+        end = index.length if end is None else min(end, index.length)
+        first, last = index.step_range(start, end)
+        steps = self.nodes.filter(order__gte=first, order__lt=last).values_list(
+            'order', 'strand', 'node__packed', 'node__seq_length')
+        buffer, buffered = [], 0
+        for order, strand, packed, length in steps.iterator(chunk_size=2000):
+            node_start = int(index.offsets[order])
+            low, high = max(start - node_start, 0), min(end - node_start, length)
+            seq = PackedSequence(packed, length)
+            buffer.append(seq.substring(low, high) if strand == '+' else seq.reverse_complement(length - high, length - low))
+            buffered += high - low
+            if buffered >= chunk_size:
+                yield ''.join(buffer)
+                buffer, buffered = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    def sequence(self, start: int = 0, end: int = None) -> str:
+        """The accession's genome spelled by this Path, or the bp range [start, end) of it"""
+        return ''.join(self.iter_sequence(start, end))
+
+    def iter_fasta(self, start: int = 0, end: int = None, line_width: int = 60) -> Iterator[str]:
+        """This Path, or the bp range [start, end) of it, as a FASTA record in chunks of whole lines.
+        The header names the range actually covered, end is clipped to the length of the Path."""
+        if start == 0 and end is None:
+            header = self.accession
+        else:
+            length = self.coordinates.length
+            header = f"{self.accession}:{start}-{length if end is None else min(end, length)}"
+        yield f">{header}\n"
+        remainder = ''
+        for chunk in self.iter_sequence(start, end):
+            chunk = remainder + chunk
+            full = len(chunk) - len(chunk) % line_width
+            yield ''.join(chunk[i:i + line_width] + '\n' for i in range(0, full, line_width))
+            remainder = chunk[full:]
+        if remainder:
+            yield remainder + '\n'
+
+    def write_fasta(self, out: TextIO, start: int = 0, end: int = None, line_width: int = 60) -> None:
+        """Writes this Path, or the bp range [start, end) of it, as a FASTA record to out."""
+        for text in self.iter_fasta(start, end, line_width):
+            out.write(text)
+
     def to_gfa(self):
         return '\t'.join(['P', self.accession, "+,".join([x.node.name + x.strand for x in self.nodes]) + "+", ",".join(['*' for x in self.nodes])])
 
@@ -150,29 +437,41 @@ class Path(models.Model):
 
 class NodeTraversal(models.Model):
     """Link from a Path to a Node it is currently traversing.  Includes strand"""
-    node = models.ForeignKey(Node, db_index=True, on_delete=models.CASCADE)
-    path = models.ForeignKey(Path, db_index=True, on_delete=models.CASCADE, help_text='')
+    # Both foreign keys are the leading column of a composite index below
+    node = models.ForeignKey(Node, db_index=False, on_delete=models.CASCADE)
+    path = models.ForeignKey(Path, db_index=False, on_delete=models.CASCADE, help_text='')
     strand = models.CharField(choices=[('+', '+'),('-', '-')], default='+', max_length=1)
     order = models.IntegerField(help_text='Defines the order a path lists traversals')  # set automatically
 
     objects = CustomSaveManager()
 
+    class Meta:
+        unique_together = ['path', 'order']  # ordered scans of a Path read straight from this index
+        indexes = [models.Index(fields=['node', 'path'])]  # which Paths traverse a Node
+
     def __repr__(self):
         if self.strand == '+':
             return self.node.seq
         else:
-            complement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-            return "".join(complement.get(base, base) for base in reversed(self.node.seq))
+            return self.node.sequence.reverse_complement()
 
     def __eq__(self, other):
         return self.node.id == other.node.id and self.strand == other.strand
 
     def save(self, **kwargs):
-        """Checks the largest 'order' value in the current path and increments by 1.
+        """Appends to the end of the Path using Path.step_count when 'order' is not set.
+        step_count is read from the database, so other Path instances may have appended before.
         IMPORTANT NOTE: save() does not get called if you do NodeTraverseal.objects.create
         or get_or_create"""
-        if self.order is None:
-            last_traversal = self.path.nodetraversal_set.all().order_by('-order').first()
-            self.order = 0 if not last_traversal else last_traversal.order + 1
-        super(NodeTraversal, self).save(**kwargs)
+        adding, appending = self._state.adding, self.order is None
+        with transaction.atomic():
+            if appending:
+                self.order = Path.objects.select_for_update().values_list('step_count', flat=True).get(pk=self.path_id)
+            super(NodeTraversal, self).save(**kwargs)
+            if adding:
+                Path.objects.filter(pk=self.path_id).update(step_count=models.F('step_count') + 1)
+                self.path.step_count = self.order + 1 if appending else self.path.step_count + 1
+            if adding and self.path.zoom == 0:
+                GraphGenome.add_to_fingerprint(self.path.graph_id,
+                                               step_item(self.path.accession, self.order, self.node.seq, self.strand))
 
@@ -0,0 +1,111 @@
+"""
+Packed nucleotide storage for Node sequences.  Sequences made only of A, C, G and T are stored at
+2 bits per base.  Anything else (N, IUPAC ambiguity codes, gaps) is stored at 4 bits per base using
+the IUPAC bitmask encoding A=1 C=2 G=4 T=8, where the complement of a code is its bit reversal.
+Encoding, decoding, reverse complement and substring extraction are vectorized with numpy.
+Soft masking (lower case) is not preserved.
+"""
+import numpy as np
+
+TWO_BIT_ALPHABET = np.frombuffer(b'ACGT', dtype=np.uint8)
+FOUR_BIT_ALPHABET = np.frombuffer(b'-ACMGRSVTWYHKDBN', dtype=np.uint8)
+TWO_BIT_COMPLEMENT = np.array([3, 2, 1, 0], dtype=np.uint8)
+FOUR_BIT_COMPLEMENT = np.array([int(format(code, '04b')[::-1], 2) for code in range(16)], dtype=np.uint8)
+INVALID = 255
+
+
+def _lookup(alphabet: np.ndarray) -> np.ndarray:
+    table = np.full(256, INVALID, dtype=np.uint8)
+    for code, char in enumerate(alphabet):
+        table[char] = code
+        table[ord(chr(char).lower())] = code
+    return table
+
+
+TWO_BIT_CODES = _lookup(TWO_BIT_ALPHABET)
+FOUR_BIT_CODES = _lookup(FOUR_BIT_ALPHABET)
+FOUR_BIT_CODES[ord('U')] = FOUR_BIT_CODES[ord('u')] = FOUR_BIT_CODES[ord('T')]
+
+
+class PackedSequence:
+    """Immutable packed sequence.  to_bytes() is a one byte header holding the bits per base
+    followed by the packed codes, first base in the most significant bits."""
+
+    def __init__(self, data: bytes, length: int):
+        self.data = bytes(data)
+        self.length = length
+        self.bits = self.data[0] if self.data else 2
+
+    @classmethod
+    def pack(cls, seq: str) -> 'PackedSequence':
+        raw = np.frombuffer(seq.encode('ascii'), dtype=np.uint8)
+        codes = TWO_BIT_CODES[raw]
+        bits = 2
+        if (codes == INVALID).any():
+            codes = FOUR_BIT_CODES[raw]
+            bits = 4
+            if (codes == INVALID).any():
+                bad = chr(raw[np.argmax(codes == INVALID)])
+                raise ValueError(f"{bad!r} is not a nucleotide or IUPAC code")
+        per_byte = 8 // bits
+        padded = np.zeros(-(-len(codes) // per_byte) * per_byte, dtype=np.uint8)
+        padded[:len(codes)] = codes
+        shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+        packed = np.bitwise_or.reduce(padded.reshape(-1, per_byte) << shifts, axis=1).astype(np.uint8)
+        return cls(bytes([bits]) + packed.tobytes(), len(codes))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes, length: int) -> 'PackedSequence':
+        return cls(blob, length)
+
+    def to_bytes(self) -> bytes:
+        return self.data
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return isinstance(other, PackedSequence) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return f"PackedSequence({str(self)!r})"
+
+    def __str__(self):
+        return self.substring(0, self.length)
+
+    @property
+    def alphabet(self):
+        return TWO_BIT_ALPHABET if self.bits == 2 else FOUR_BIT_ALPHABET
+
+    @property
+    def complement(self):
+        return TWO_BIT_COMPLEMENT if self.bits == 2 else FOUR_BIT_COMPLEMENT
+
+    def codes(self, start: int = 0, end: int = None) -> np.ndarray:
+        """Unpacked codes of bases [start, end) without decoding the rest of the sequence."""
+        end = self.length if end is None else min(end, self.length)
+        start = max(start, 0)
+        if start >= end:
+            return np.zeros(0, dtype=np.uint8)
+        per_byte = 8 // self.bits
+        first, last = start // per_byte, -(-end // per_byte)
+        packed = np.frombuffer(self.data, dtype=np.uint8, offset=1 + first, count=last - first)
+        shifts = np.arange(8 - self.bits, -1, -self.bits, dtype=np.uint8)
+        codes = (packed[:, None] >> shifts) & ((1 << self.bits) - 1)
+        offset = first * per_byte
+        return codes.reshape(-1)[start - offset:end - offset]
+
+    def substring(self, start: int = 0, end: int = None) -> str:
+        return self.alphabet[self.codes(start, end)].tobytes().decode('ascii')
+
+    def reverse_complement(self, start: int = 0, end: int = None) -> str:
+        """Reverse complement of bases [start, end) given in forward coordinates."""
+        return self.alphabet[self.complement[self.codes(start, end)[::-1]]].tobytes().decode('ascii')
+
+
+def canonical(seq: str) -> str:
+    """seq as it reads back from packed storage: upper case with U read as T"""
+    return str(PackedSequence.pack(seq))
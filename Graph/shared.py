@@ -0,0 +1,195 @@
+"""
+Read-only snapshots of a graph layer that every process on a host maps from the same file.
+Web workers serving the same summarized graph would each hold their own copy of it.  Instead
+publish() writes the node table, the links as CSR arrays and the specimen bitsets of one ZoomLevel
+to a flat file, and attach() maps it with mmap.  The arrays are numpy views straight into the
+mapping, so all workers share the operating system's page cache and memory is paid once per host.
+
+publish() replaces the file atomically.  Processes that already mapped the old file keep reading
+it until their next attach(), which notices the new file and maps that instead.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from Graph.models import GraphGenome, Node, Path, NodeTraversal
+from Graph.utils import padded
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VGSHARED'
+VERSION = 1
+# magic, version, graph id, zoom, node count, link count, path count, name width, metadata length
+HEADER = struct.Struct('<8s8Q')
+
+
+def shared_graph_dir() -> str:
+    return settings.SHARED_GRAPH_DIR
+
+
+def shared_graph_file(graph_id, zoom: int = 0) -> str:
+    return os.path.join(shared_graph_dir(), f"graph{graph_id}_zoom{zoom}.bin")
+
+
+def section_layout(nodes: int, links: int, paths: int, name_width: int) -> List[Tuple[str, np.dtype, tuple]]:
+    """Name, dtype and shape of each array in file order.  Every array starts 8 byte aligned."""
+    return [('names', np.dtype(f'S{name_width}'), (nodes,)),
+            ('seq_lengths', np.dtype('<i8'), (nodes,)),
+            ('link_starts', np.dtype('<i8'), (nodes + 1,)),  # CSR row pointers
+            ('link_targets', np.dtype('<i4'), (links,)),
+            ('specimens', np.dtype('u1'), (nodes, (paths + 7) // 8))]  # bit p of a row: Path p visits
+
+
+class SharedGraph:
+    """Arrays of one ZoomLevel backed by a read-only memory map.  Nodes are numbered by their
+    position in the sorted names array, Paths by their position in accessions."""
+    def __init__(self, buffer, file_name: str = None):
+        magic, version, self.graph_id, self.zoom, nodes, links, paths, name_width, meta_length = \
+            HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{file_name} is not a version {VERSION} shared graph")
+        self.buffer = buffer  # keeps the mapping alive as long as the arrays
+        self.file_name = file_name
+        offset = padded(HEADER.size)
+        arrays = {}
+        for name, dtype, shape in section_layout(nodes, links, paths, name_width):
+            count = int(np.prod(shape))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += padded(count * dtype.itemsize)
+        self.names = arrays['names']
+        self.seq_lengths = arrays['seq_lengths']
+        self.link_starts = arrays['link_starts']
+        self.link_targets = arrays['link_targets']
+        self.specimen_bits = arrays['specimens']
+        meta = json.loads(bytes(buffer[offset:offset + meta_length]).decode())
+        self.fingerprint = meta['fingerprint']
+        self.accessions = meta['accessions']
+
+    @classmethod
+    def open(cls, file_name: str) -> 'SharedGraph':
+        with open(file_name, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), file_name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"SharedGraph(graph {self.graph_id} zoom {self.zoom}, {len(self)} nodes, " \
+               f"{len(self.link_targets)} links, {len(self.accessions)} paths)"
+
+    def node_index(self, name: str) -> int:
+        """Binary search in the sorted node names"""
+        key = name.encode()
+        index = int(np.searchsorted(self.names, key))
+        if index == len(self.names) or self.names[index] != key:
+            raise KeyError(name)
+        return index
+
+    def node_name(self, index: int) -> str:
+        return self.names[index].decode()
+
+    def successors(self, name: str) -> List[str]:
+        """Names of the Nodes that some Path visits right after name"""
+        index = self.node_index(name)
+        targets = self.link_targets[self.link_starts[index]:self.link_starts[index + 1]]
+        return [self.node_name(target) for target in targets.tolist()]
+
+    def visits(self, name: str, path_index: int) -> bool:
+        row = self.specimen_bits[self.node_index(name)]
+        return bool(row[path_index >> 3] & (0x80 >> (path_index & 7)))
+
+    def specimens(self, name: str) -> List[str]:
+        """Accessions of the Paths visiting name"""
+        bits = np.unpackbits(self.specimen_bits[self.node_index(name)])[:len(self.accessions)]
+        return [self.accessions[p] for p in np.flatnonzero(bits).tolist()]
+
+
+def snapshot_arrays(graph_id, zoom: int) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    """Reads one ZoomLevel from the database into the arrays of the shared file"""
+    node_rows = sorted((name.encode(), length) for name, length in
+                       Node.objects.filter(graph_id=graph_id, zoom=zoom).values_list('name', 'seq_length'))
+    names = np.array([name for name, _ in node_rows], dtype=f'S{max((len(n) for n, _ in node_rows), default=1)}')
+    node_numbers = {name.decode(): i for i, (name, _) in enumerate(node_rows)}
+    path_rows = list(Path.objects.filter(graph_id=graph_id, zoom=zoom).order_by('accession')
+                     .values_list('id', 'accession'))
+    path_numbers = {path_id: i for i, (path_id, _) in enumerate(path_rows)}
+
+    steps = NodeTraversal.objects.filter(path__graph_id=graph_id, path__zoom=zoom).order_by('path_id', 'order')
+    rows = [(path_numbers[path_id], order, node_numbers[node_id]) for path_id, order, node_id in
+            steps.values_list('path_id', 'order', 'node_id').iterator(chunk_size=10000)]
+    path_of, order, node = np.array(rows, dtype=np.int64).reshape(-1, 3).T
+    consecutive = (path_of[1:] == path_of[:-1]) & (order[1:] == order[:-1] + 1)
+    links = np.unique(node[:-1][consecutive] * max(len(names), 1) + node[1:][consecutive])
+    sources, targets = np.divmod(links, max(len(names), 1))
+    link_starts = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(names)), out=link_starts[1:])
+
+    specimens = np.zeros((len(names), (len(path_rows) + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(specimens, (node, path_of >> 3), (0x80 >> (path_of & 7)).astype(np.uint8))
+    arrays = {'names': names,
+              'seq_lengths': np.array([length for _, length in node_rows], dtype=np.int64),
+              'link_starts': link_starts,
+              'link_targets': targets.astype(np.int32),
+              'specimens': specimens}
+    return arrays, [accession for _, accession in path_rows]
+
+
+def publish(graph: GraphGenome, zoom: int = 0) -> str:
+    """Writes the shared file of one ZoomLevel of graph and returns its name.  Call it again after
+    the graph changes, attached processes pick up the new file on their next attach()."""
+    arrays, accessions = snapshot_arrays(graph.pk, zoom)
+    fingerprint = GraphGenome.objects.values_list('fingerprint', flat=True).get(pk=graph.pk)
+    meta = json.dumps({'fingerprint': fingerprint, 'accessions': accessions}).encode()
+    file_name = shared_graph_file(graph.pk, zoom)
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    temporary = f"{file_name}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, graph.pk, zoom, len(arrays['names']), len(arrays['link_targets']),
+                            len(accessions), arrays['names'].dtype.itemsize, len(meta)))
+        f.write(bytes(padded(HEADER.size) - HEADER.size))
+        for name, dtype, shape in section_layout(len(arrays['names']), len(arrays['link_targets']),
+                                                 len(accessions), arrays['names'].dtype.itemsize):
+            data = arrays[name].astype(dtype, copy=False).tobytes()
+            f.write(data + bytes(padded(len(data)) - len(data)))
+        f.write(meta)
+    os.replace(temporary, file_name)  # readers see either the old or the new file, never a partial one
+    return file_name
+
+
+_attached = {}  # file name: (inode and mtime, SharedGraph) for this process
+
+
+def attach(graph_id, zoom: int = 0) -> SharedGraph:
+    """The SharedGraph of this ZoomLevel mapped into this process.  Costs one stat() per call once
+    mapped.  Raises FileNotFoundError if the layer was never published."""
+    file_name = shared_graph_file(graph_id, zoom)
+    stat = os.stat(file_name)
+    version = (stat.st_ino, stat.st_mtime_ns)
+    attached = _attached.get(file_name)
+    if attached is None or attached[0] != version:
+        attached = _attached[file_name] = (version, SharedGraph.open(file_name))
+    return attached[1]
+
+
+def attach_all() -> List[SharedGraph]:
+    """Maps every published file.  Called by the WSGI entry point so that a server forking its
+    workers after loading the application hands them the mappings already in place.  A file that
+    cannot be mapped is logged and skipped so that it does not stop the application from starting."""
+    directory = shared_graph_dir()
+    if not os.path.isdir(directory):
+        return []
+    graphs = []
+    for entry in sorted(os.listdir(directory)):
+        if entry.startswith('graph') and entry.endswith('.bin'):
+            try:
+                graph_id, zoom = entry[len('graph'):-len('.bin')].split('_zoom')
+                graphs.append(attach(int(graph_id), int(zoom)))
+            except (OSError, ValueError, KeyError, struct.error):
+                logger.exception("Skipping shared graph %s", os.path.join(directory, entry))
+    return graphs
@@ -1,13 +1,30 @@
+import gzip
+import io
+import json
+import numpy as np
+from collections import defaultdict
+import tempfile
 import unittest
+from unittest import mock
 from datetime import datetime
 
-from django.test import TestCase
+from django.db import connection
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from typing import List
 import os
 from os.path import join
-from Graph.gfa import GFA
-from Graph.models import Node, GraphGenome, Path
+from Graph.bulk import bulk_load
+from Graph.cache import tiles, cached_tile
+from Graph import views, wire
+from Graph.gfa import GFA, iter_gfa
+from Graph.sequence import PackedSequence
+from Graph.shared import publish, attach, attach_all
+from Graph.models import Node, GraphGenome, Path, NodeTraversal, EMPTY_FINGERPRINT, NodeMissingError
 from Graph.sort import DAGify
+from Graph.working import REVERSE
 
 # Define the working directory
 from vgbrowser.settings import BASE_DIR
@@ -19,7 +36,7 @@ a, b, c, d, e = 'a', 'b', 'c', 'd', 'e'  # Paths must be created first
 x, y, z = 'x', 'y', 'z'
 
 
-def build_from_test_slices(cmd: List):
+def build_from_test_slices(cmd: List, graph_name='test_data'):
     """This factory uses test data shorthand for linear graph slices to build
     a database GraphGenome with all the necessary Paths and Nodes.  Path order populated in the order
     that they are mentioned in the slices.  Currently, this is + only and does not support non-linear
@@ -27,7 +44,7 @@ def build_from_test_slices(cmd: List):
     if isinstance(cmd, str):
         cmd = eval(cmd)
     # preemptively grab all the path names from every odd list entry
-    graph = GraphGenome.objects.get_or_create(name='test_data')[0]  # + str(datetime.now())
+    graph = GraphGenome.objects.get_or_create(name=graph_name)[0]  # + str(datetime.now())
     node_count = 0
     paths = {key for sl in cmd for i in range(0, len(sl), 2) for key in sl[i + 1]}
     path_objs = {}
@@ -37,7 +54,8 @@ def build_from_test_slices(cmd: List):
         try:
             for i in range(0, len(sl), 2):
                 paths_mentioned = [path_objs[key] for key in sl[i + 1]]
-                node, is_new = Node.objects.get_or_create(seq=sl[i], name=graph.name + str(node_count), graph=graph)
+                node, is_new = Node.objects.get_or_create(name=graph.name + str(node_count), graph=graph,
+                                                          defaults={'seq': sl[i]})
                 node_count += 1
                 for path in paths_mentioned:
                     path.append_node(node, '+')
@@ -47,6 +65,13 @@ def build_from_test_slices(cmd: List):
     return graph
 
 
+def count_queries(function, *args, **kwargs) -> int:
+    """Number of database queries function issues"""
+    with CaptureQueriesContext(connection) as queries:
+        function(*args, **kwargs)
+    return len(queries)
+
+
 class GraphTest(TestCase):
     """Constructing a node with an existing Path object will modify that Path object (doubly linked)
     which means care must be taken when constructing Graphs.  From factory_input we have an example of
@@ -76,11 +101,68 @@ class GraphTest(TestCase):
                         ['C', {a, b, e}, 'T', {c, d}],  # [9] path slip
                         ['C', {a, b, c}, 'T', {d}],  # [10]path slip
                         ['TATA', {a, b, c, d}]]  # [11] anchor
-        g1, g2 = build_from_test_slices(original_test), build_from_test_slices(original_test)
+        g1, g2 = build_from_test_slices(original_test), build_from_test_slices(original_test, 'test_data2')
         assert g1 == g2, \
             ('\n' + repr(g1) + '\n' + repr(g2))
         g_from_GFA = self.test_example_graph()  # comes from matching
         assert g1 == g_from_GFA, repr(g1) + '\n' + repr(g_from_GFA)
+        g3 = build_from_test_slices(original_test[:-1] + [['TATT', {a, b, c, d}]], 'test_data3')
+        assert g1 != g3, "Equality is based on content, not just counts"
+
+    def test_unsaved_graphs(self):
+        unsaved = GraphGenome(name='a')
+        self.assertEqual(unsaved, unsaved)
+        self.assertNotEqual(unsaved, GraphGenome(name='b'))
+        self.assertNotEqual(unsaved, self.test_example_graph())
+
+    def test_fingerprint_is_incremental(self):
+        graph = self.test_example_graph()
+        incremental = GraphGenome.objects.get(pk=graph.pk).fingerprint
+        self.assertNotEqual(incremental, EMPTY_FINGERPRINT)
+        self.assertEqual(graph.rebuild_fingerprint(), incremental)
+
+    def test_append_uses_step_count(self):
+        graph = self.test_example_graph()
+        path = graph.paths.get(accession='a')
+        steps = path.nodes.count()
+        self.assertEqual(path.step_count, steps)
+        node = Node.objects.get(name='1')
+        queries = count_queries(path.append_node, node, '-')
+        self.assertEqual(Path.objects.get(pk=path.pk).step_count, steps + 1)
+        self.assertEqual(path.nodes.last().order, steps)
+        other = graph.paths.get(accession='a')
+        other.append_nodes([('2', '+')])
+        path.append_node(node, '+')  # after the step appended through the other instance
+        self.assertEqual(list(path.nodes.values_list('node_id', 'order'))[steps:],
+                         [('1', steps), ('2', steps + 1), ('1', steps + 2)])
+        self.assertEqual(path.step_count, steps + 3)
+        path.append_nodes([('2', '+')] * 100)
+        self.assertEqual(count_queries(path.append_node, node, '-'), queries)  # independent of Path length
+
+    def test_append_nodes_in_batches(self):
+        graph = self.test_example_graph()
+        path = graph.paths.get(accession='a')
+        steps = path.step_count
+        added = [('1', '+'), ('2', '-'), ('1', '+'), ('3', '+'), ('2', '+')]
+        batch = count_queries(path.append_nodes, added[:2])
+        self.assertEqual(count_queries(path.append_nodes, added * 20), batch)  # independent of the number of steps
+        steps += 2 + 100
+        self.assertEqual(count_queries(path.append_nodes, added, batch_size=2), 3 * batch)
+        self.assertEqual(path.step_count, steps + 5)
+        self.assertEqual(list(path.nodes.values_list('node_id', 'strand'))[steps:], added)
+        self.assertEqual(GraphGenome.objects.get(pk=graph.pk).fingerprint, graph.rebuild_fingerprint())
+        with self.assertRaises(NodeMissingError):
+            path.append_nodes([('1', '+'), ('nowhere', '+')])
+        self.assertEqual(Path.objects.get(pk=path.pk).step_count, steps + 5)
+
+    def test_append_node_to_path(self):
+        graph = self.test_example_graph()
+        steps = graph.paths.get(accession='b').step_count
+        graph.append_node_to_path('new', '+', 'b')
+        graph.append_node_to_path('1', '-', 'b')
+        self.assertEqual(list(graph.paths.get(accession='b').nodes.values_list('node_id', 'strand'))[steps:],
+                         [('new', '+'), ('1', '-')])
+        self.assertEqual(graph.nodes.get(name='new').seq, '')
 
 
 @unittest.skip  # DAGify has not been converted to databases yet.
@@ -173,6 +255,404 @@ class DAGifyTest(TestCase):
 
 
 
+class CoordinateTest(TestCase):
+    """ test class of coordinates.py and the Path coordinate lookups
+    """
+    def test_position_to_step(self):
+        graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        path = graph.paths.get(accession='x')  # CAAATAAG G C TTG G AAATTTTCTGGAGTTCTAT ...
+        self.assertEqual(len(path.coordinates), 10)
+        self.assertEqual(path.step_at(0).node.name, '1')
+        self.assertEqual(path.step_at(7).node.name, '1')
+        self.assertEqual(path.step_at(8).node.name, '3')
+        self.assertEqual(path.step_at(10).node.name, '6')
+        self.assertEqual(path.position_of(path.nodes[3]), 10)
+        self.assertEqual([t.node.name for t in path.steps_in_range(9, 14)], ['5', '6', '8'])
+        with self.assertRaises(IndexError):
+            path.step_at(path.coordinates.length)
+
+    def test_index_follows_appends(self):
+        graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        path = graph.paths.get(accession='x')
+        length = path.coordinates.length
+        path.append_node(Node.objects.get(name='1'), '+')
+        path = graph.paths.get(accession='x')  # persisted index is stale
+        self.assertEqual(path.coordinates.length, length + 8)
+        self.assertEqual(path.step_at(length).order, 10)
+
+
+class WindowViewTest(TestCase):
+    """ test class of the region query endpoints in views.py
+    """
+    def setUp(self):
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        self.url = reverse('window', args=[self.graph.pk])
+
+    def test_rank_window(self):
+        response = self.client.get(self.url, {'path': 'x', 'rank_start': 1, 'rank_end': 4})
+        self.assertEqual(response.status_code, 200)
+        window = response.json()
+        self.assertEqual(sorted(n['name'] for n in window['nodes']), ['3', '5', '6'])
+        self.assertEqual(window['paths']['x'], [[1, '3', '+'], [2, '5', '+'], [3, '6', '+']])
+        self.assertEqual(window['paths']['y'], [[2, '5', '+'], [3, '6', '+']])
+        self.assertIn(['5', '+', '6', '+'], window['links'])
+
+    def test_bp_window_and_pagination(self):
+        response = self.client.get(self.url, {'path': 'x', 'start': 9, 'end': 14, 'page_size': 2})
+        window = response.json()
+        self.assertEqual((window['rank_start'], window['rank_end'], window['pages']), (2, 5, 2))
+        self.assertEqual(sorted(n['name'] for n in window['nodes']), ['5', '6'])
+        window = self.client.get(self.url, {'path': 'x', 'start': 9, 'end': 14, 'page_size': 2, 'page': 2}).json()
+        self.assertEqual([n['name'] for n in window['nodes']], ['8'])
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, {'path': 'x'})
+        cached = self.client.get(self.url, {'path': 'x'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.graph.paths.get(accession='x').append_node(Node.objects.get(name='1'), '+')
+        changed = self.client.get(self.url, {'path': 'x'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_bad_request(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'path': 'x', 'page': 9}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'path': 'nobody'}).status_code, 404)
+
+
+class WireFormatTest(TestCase):
+    """ test class of wire.py
+    """
+    def setUp(self):
+        tiles().clear()
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        self.url = reverse('window', args=[self.graph.pk])
+
+    def test_binary_window_decodes_to_json_window(self):
+        params = {'path': 'x', 'rank_start': 1, 'rank_end': 6}
+        expected = self.client.get(self.url, params).json()
+        response = self.client.get(self.url, dict(params, format='binary'))
+        self.assertEqual(response['Content-Type'], wire.CONTENT_TYPE)
+        decoded = wire.decode_window(response.content)
+        decoded['links'] = [list(link) for link in decoded['links']]
+        self.assertEqual(decoded, expected)
+
+    def test_sections_are_aligned_typed_arrays(self):
+        window = views.window_contents(self.graph.paths.get(accession='x'), 0, 10)
+        header, sections = wire.decode_sections(wire.encode_window(window))
+        self.assertEqual(header['rank_end'], 10)
+        names = [node['name'] for node in window['nodes']]
+        accessions = sorted(window['paths'])
+        bits = np.unpackbits(sections['membership'], axis=1)[:, :len(accessions)]
+        for node, row in zip(names, bits.tolist()):
+            visiting = [a for a in accessions if any(step[1] == node for step in window['paths'][a])]
+            self.assertEqual([a for a, bit in zip(accessions, row) if bit], visiting)
+        self.assertEqual(sections['step_counts'].sum(), len(sections['step_nodes']))
+        empty = views.window_contents(self.graph.paths.get(accession='x'), 50, 60)
+        self.assertEqual(wire.decode_window(wire.encode_window(empty))['nodes'], [])
+
+
+class WorkingGraphTest(TestCase):
+    """ test class of working.py
+    """
+    def setUp(self):
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+
+    def state(self, working):
+        return {accession: [(working.names[n], '-' if r else '+') for n, r in zip(steps.tolist(), strands.tolist())]
+                for accession, steps, strands in zip(working.accessions, working.steps, working.strands)}
+
+    def database_state(self):
+        steps = defaultdict(list)
+        for accession, node_id, strand in NodeTraversal.objects.filter(path__graph=self.graph).order_by(
+                'path_id', 'order').values_list('path__accession', 'node_id', 'strand'):
+            steps[accession].append((node_id, strand))
+        return dict(steps)
+
+    def test_load_in_three_queries(self):
+        with self.assertNumQueries(3):
+            working = self.graph.working()
+        self.assertEqual(self.state(working), self.database_state())
+        self.assertEqual(working.seqs[working.node_index['1']], 'CAAATAAG')
+        self.assertIn((working.node_index['1'], working.node_index['3']), set(map(tuple, working.links().tolist())))
+        with self.assertNumQueries(2):  # nothing changed, only the savepoint
+            working.save()
+
+    def test_save_writes_difference(self):
+        working = self.graph.working()
+        x, y = working.accessions.index('x'), working.accessions.index('y')
+        working.append_steps(x, [working.node_index['1']], [REVERSE])
+        working.strands[y][3] = REVERSE
+        working.seqs[working.node_index['2']] = 'AC'
+        new = working.add_node('new', 'GGG')
+        w = working.add_path('w')
+        working.set_steps(w, [new, working.node_index['15']])
+        z = working.accessions.index('z')
+        working.set_steps(z, [n for n in working.steps[z] if n != working.node_index['7']])
+        working.delete_node(working.node_index['7'])
+        working.save()
+
+        expected = self.state(working)
+        self.assertEqual(self.database_state(), expected)
+        self.assertEqual(self.state(self.graph.working()), expected)
+        self.assertEqual(Node.objects.get(name='2').seq, 'AC')
+        self.assertFalse(Node.objects.filter(name='7').exists())
+        self.assertEqual(Path.objects.get(graph=self.graph, accession='x').step_count, len(expected['x']))
+        self.assertEqual(GraphGenome.objects.get(pk=self.graph.pk).fingerprint, self.graph.rebuild_fingerprint())
+        with self.assertRaises(ValueError):
+            working.delete_node(working.node_index['1'])
+
+    def test_sequence_edit_refreshes_coordinates(self):
+        x = self.graph.paths.get(accession='x')
+        before = x.sequence()
+        self.assertEqual(x.coordinates.length, len(before))  # persisted index
+        working = self.graph.working()
+        working.seqs[working.node_index['1']] = 'acg'  # visited by every Path, 8 bp before
+        with mock.patch.object(GraphGenome, 'rebuild_fingerprint') as rebuild:
+            working.save()
+        rebuild.assert_not_called()
+        x = self.graph.paths.get(accession='x')
+        self.assertIsNone(x.coordinates_blob)
+        self.assertEqual(x.sequence(), 'ACG' + before[8:])
+        self.assertEqual(x.coordinates.length, len(before) - 5)
+        self.assertEqual(x.step_at(3).node_id, '3')
+        self.assertEqual(GraphGenome.objects.get(pk=self.graph.pk).fingerprint, self.graph.rebuild_fingerprint())
+
+
+class DownloadTest(TestCase):
+    """ test class of the streamed downloads in views.py
+    """
+    def setUp(self):
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+
+    def content(self, name, **params):
+        response = self.client.get(reverse(name, args=[self.graph.pk]), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_gfa_round_trip(self):
+        text = self.content('gfa')
+        with tempfile.NamedTemporaryFile('w', suffix='.gfa') as f:
+            f.write(text)
+            f.flush()
+            copy = GFA.load_from_gfa(f.name)
+        self.assertEqual(copy.fingerprint(), GraphGenome.objects.get(pk=self.graph.pk).fingerprint)
+        self.assertEqual(text, ''.join(iter_gfa(self.graph, chunk_size=2)))  # batches join seamlessly
+
+    def test_nodes_and_fasta(self):
+        nodes = json.loads(self.content('node_list'))
+        self.assertEqual(nodes, [{'name': node.name, 'seq': node.seq} for node in self.graph.nodes.order_by('name')])
+        self.assertEqual(json.loads(self.content('node_list', zoom=3)), [])
+        out = io.StringIO()
+        self.graph.paths.get(accession='x').write_fasta(out)
+        self.assertEqual(self.content('fasta', path='x'), out.getvalue())
+        self.assertEqual(self.content('fasta').count('>'), self.graph.paths.count())
+        self.assertEqual(self.client.get(reverse('fasta', args=[self.graph.pk]), {'path': 'nobody'}).status_code, 404)
+
+    def test_gzip_on_the_fly(self):
+        response = self.client.get(reverse('gfa', args=[self.graph.pk]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.content('gfa'))
+
+
+class TileCacheTest(TestCase):
+    """ test class of cache.py
+    """
+    def setUp(self):
+        tiles().clear()
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+
+    def test_repeat_views_skip_database(self):
+        url = reverse('window', args=[self.graph.pk])
+        first = self.client.get(url, {'path': 'x', 'start': 0, 'end': 20}).json()
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, {'path': 'x', 'start': 0, 'end': 20}).json()
+        self.assertEqual(first, second)
+        tables = {NodeTraversal._meta.db_table, Node._meta.db_table}  # only graph version and reference Path
+        self.assertFalse([q['sql'] for q in queries.captured_queries if any(t in q['sql'] for t in tables)])
+
+    def test_invalidated_by_content_change(self):
+        built = []
+        build = lambda: built.append(1) or len(built)
+        self.assertEqual(cached_tile(self.graph.pk, 0, ('x', 0, 10), build), 1)
+        self.assertEqual(cached_tile(self.graph.pk, 0, ('x', 0, 10), build), 1)
+        self.assertEqual(cached_tile(self.graph.pk, 1, ('x', 0, 10), build), 2)  # other zoom level
+        self.graph.paths.get(accession='y').build_coordinate_index()  # derived data only
+        self.assertEqual(cached_tile(self.graph.pk, 0, ('x', 0, 10), build), 1)
+        Node.objects.create(seq='ACGT', name='new', graph=self.graph)
+        self.assertEqual(cached_tile(self.graph.pk, 0, ('x', 0, 10), build), 3)
+
+    def test_invalidated_by_other_processes(self):
+        """A write in another worker or a management command runs with its own cache instance"""
+        built = []
+        build = lambda: built.append(1) or len(built)
+        url = reverse('window', args=[self.graph.pk])
+        etag = self.client.get(url, {'path': 'x'})['ETag']
+        self.assertEqual(cached_tile(self.graph.pk, 0, ('x', 0, 10), build), 1)
+        other_process = LocMemCache('other-process', {})
+        with mock.patch('Graph.cache.tiles', return_value=other_process):
+            Node.objects.create(seq='ACGT', name='new', graph=self.graph)
+        self.assertEqual(cached_tile(self.graph.pk, 0, ('x', 0, 10), build), 2)
+        self.assertEqual(self.client.get(url, {'path': 'x'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SharedGraphTest(TestCase):
+    """ test class of shared.py
+    """
+    def setUp(self):
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SHARED_GRAPH_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_same_content_as_database(self):
+        publish(self.graph)
+        shared = attach(self.graph.pk)
+        self.assertFalse(shared.names.flags.writeable)  # a view of the read-only mapping
+        steps = defaultdict(list)
+        for accession, node_id in NodeTraversal.objects.filter(path__graph=self.graph).order_by(
+                'path_id', 'order').values_list('path__accession', 'node_id'):
+            steps[accession].append(node_id)
+        for node in self.graph.nodes:
+            self.assertEqual(shared.seq_lengths[shared.node_index(node.name)], node.seq_length)
+            self.assertEqual(shared.specimens(node.name), sorted(a for a in steps if node.name in steps[a]))
+            self.assertEqual(shared.successors(node.name), sorted(
+                {b for visits in steps.values() for a, b in zip(visits, visits[1:]) if a == node.name}))
+        self.assertTrue(shared.visits('1', shared.accessions.index('x')))
+        self.assertEqual(shared.fingerprint, GraphGenome.objects.get(pk=self.graph.pk).fingerprint)
+        with self.assertRaises(KeyError):
+            shared.node_index('missing')
+
+    def test_attach_follows_publish(self):
+        publish(self.graph)
+        shared = attach(self.graph.pk)
+        self.assertIs(attach(self.graph.pk), shared)
+        Path.objects.create(accession='late', graph=self.graph).append_node(Node.objects.get(name='1'), '+')
+        publish(self.graph)
+        updated = attach(self.graph.pk)
+        self.assertIsNot(updated, shared)
+        self.assertIn('late', updated.specimens('1'))
+        self.assertNotIn('late', shared.specimens('1'))  # old mapping stays readable
+        with self.assertRaises(FileNotFoundError):
+            attach(self.graph.pk, zoom=1)
+
+    def test_attach_all_skips_truncated_files(self):
+        publish(self.graph)
+        truncated = publish(self.graph, zoom=1)
+        with open(truncated, 'r+b') as f:
+            f.truncate(40)
+        with self.assertLogs('Graph.shared', 'ERROR') as logs:
+            graphs = attach_all()
+        self.assertEqual([(shared.graph_id, shared.zoom) for shared in graphs], [(self.graph.pk, 0)])
+        self.assertIn(truncated, logs.output[0])
+
+
+class ZoomLevelTest(TestCase):
+    """ test class of summarization layers stored in ZoomLevel
+    """
+    def setUp(self):
+        self.graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        self.layer = self.graph.zoom_level(1)
+        nodes = {node.name: node for node in self.graph.nodes}
+        for summary, names in [('s1', '12345'), ('s2', '678'), ('s3', ['9', '10', '11', '12', '13', '14', '15'])]:
+            self.layer.add_summary_node(summary, [nodes[name] for name in names])
+        self.layer.build_paths()
+
+    def test_build_paths(self):
+        self.assertEqual(self.layer.paths.count(), 3)
+        self.assertEqual(self.graph.paths.count(), 3)  # summary layers are kept apart from zoom 0
+        self.assertEqual(self.graph.nodes.count(), 15)
+        x = self.layer.paths.get(accession='x')
+        self.assertEqual([t.node.name for t in x.nodes], ['s1', 's2', 's3'])
+        self.assertEqual(sorted(n.name for n in Node.objects.get(name='s2').children.all()), ['6', '7', '8'])
+        self.assertEqual(x.step_at(12).node.name, 's2')  # bp coordinates of the full resolution Path
+        self.assertEqual(x.coordinates.length, self.graph.paths.get(accession='x').coordinates.length)
+
+    def test_window_at_zoom(self):
+        url = reverse('window', args=[self.graph.pk])
+        window = self.client.get(url, {'path': 'y', 'zoom': 1}).json()
+        self.assertEqual(window['paths']['y'], [[0, 's1', '+'], [1, 's2', '+'], [2, 's3', '+']])
+        self.assertEqual(len(window['links']), 2)
+
+
+class SequenceTest(TestCase):
+    """ test class of sequence.py
+    """
+    def test_pack(self):
+        packed = PackedSequence.pack('ACGTACGTA')
+        self.assertEqual((packed.bits, len(packed.to_bytes())), (2, 4))  # header + 9 bases in 3 bytes
+        self.assertEqual(str(packed), 'ACGTACGTA')
+        self.assertEqual(packed.substring(2, 7), 'GTACG')
+        self.assertEqual(packed.reverse_complement(), 'TACGTACGT')
+        ambiguous = PackedSequence.pack('ACNRT')
+        self.assertEqual((ambiguous.bits, str(ambiguous)), (4, 'ACNRT'))
+        self.assertEqual(ambiguous.reverse_complement(), 'AYNGT')
+        with self.assertRaises(ValueError):
+            PackedSequence.pack('ACGZ')
+
+    def test_path_sequence(self):
+        graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        x = graph.paths.get(accession='x')
+        expected = ''.join(repr(traversal) for traversal in x.nodes)
+        self.assertEqual(x.sequence(), expected)
+        self.assertEqual(''.join(x.iter_sequence(chunk_size=5)), expected)
+        self.assertEqual(x.sequence(5, 17), expected[5:17])
+        x.append_node(Node.objects.get(name='1'), '-')
+        self.assertEqual(x.sequence(len(expected) + 2), 'TATTTG')  # slice of reverse complement CTTATTTG
+        out = io.StringIO()
+        x.write_fasta(out, 0, 25, line_width=10)
+        self.assertEqual(out.getvalue(), '>x:0-25\n' + '\n'.join([expected[:10], expected[10:20], expected[20:25]]) + '\n')
+        out = io.StringIO()
+        x.write_fasta(out, 5)
+        self.assertEqual(out.getvalue().split('\n')[0], f'>x:5-{len(expected) + 8}')
+        out = io.StringIO()
+        x.write_fasta(out, 5, 10 ** 6)
+        self.assertEqual(out.getvalue().split('\n')[0], f'>x:5-{len(expected) + 8}')
+
+    def test_long_node(self):
+        graph = GraphGenome.objects.create(name='long')
+        seq = 'AACG' * 10000
+        Node(seq=seq, name='long', graph=graph).save()
+        node = Node.objects.get(name='long')
+        self.assertEqual(node.seq, seq)
+        self.assertEqual(len(node.packed), 1 + len(seq) // 4)
+        path = Path(accession='a', graph=graph)
+        path.save()
+        path.append_node(node, '-')
+        self.assertEqual(repr(path.nodes[0]), 'CGTT' * 10000)
+
+
+class BulkLoadTest(TransactionTestCase):
+    """ test class of bulk.py.  Runs outside of a transaction like a real import.
+    """
+    def index_sql(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Graph_nodetraversal'")
+            return sorted(row[0] or '' for row in cursor.fetchall())
+
+    def test_bulk_load(self):
+        indexes = self.index_sql()
+        with CaptureQueriesContext(connection) as queries, bulk_load() as report:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 0)
+            self.assertEqual([sql for sql in self.index_sql() if sql.startswith('CREATE INDEX')], [])
+            graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph()
+        self.assertEqual(self.index_sql(), indexes)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])  # no table scans for the report
+        self.assertEqual(report.rows, 15 + 3 + 30)  # Nodes, Paths and steps
+        self.assertGreater(report.rows_per_second, 0)
+        self.assertEqual(graph.paths.get(accession='z').nodes.count(), 10)
+
+    def test_bulk_import(self):
+        graph = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa")).to_graph(bulk=True)
+        self.assertEqual(graph.nodes.count(), 15)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 2)  # restored to FULL
+
+
 class GFATest(TestCase):
     """ test class of gfa.py
     """
@@ -201,6 +681,54 @@ class GFATest(TestCase):
         new_gfa = GFA.from_graph(graph)
         self.assertFalse(self.is_different(gfa.gfa, new_gfa.gfa))
 
+    def test_reimport_is_deduplicated(self):
+        graph, gfa = self.make_graph_from_gfa()
+        self.assertEqual(gfa.fingerprint(), GraphGenome.objects.get(pk=graph.pk).fingerprint)
+        self.assertEqual(gfa.to_graph().pk, graph.pk)
+        self.assertEqual(GraphGenome.objects.count(), 1)
+
+    def test_resume_interrupted_import(self):
+        gfa = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa"))
+        original_bulk_create = NodeTraversal.objects.bulk_create
+        calls = []
+
+        def crash_on_fourth_batch(objs, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 4 and len(objs) == 4:
+                raise IOError("Simulated crash")
+            return original_bulk_create(objs, **kwargs)
+
+        with mock.patch.object(NodeTraversal.objects, 'bulk_create', crash_on_fourth_batch):
+            with self.assertRaises(IOError):
+                gfa.to_graph(batch_size=4)  # x is 3 batches: 4 + 4 + 2 steps, crash in y
+        graph = GraphGenome.objects.get(name=gfa.source_path)
+        self.assertEqual([p.nodes.count() for p in graph.paths.order_by('accession')], [10, 0])
+        self.assertEqual(graph.fingerprint, GraphGenome.objects.get(pk=graph.pk).rebuild_fingerprint())
+
+        changed = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test.gfa"))
+        changed.gfa.segment('1').sequence = 'T'  # the file was edited since the interrupted import
+        with self.assertRaisesRegex(ValueError, 'does not match'):
+            changed.to_graph(batch_size=100)
+        self.assertEqual([p.nodes.count() for p in graph.paths.order_by('accession')], [10, 0])
+
+        calls.clear()
+        with mock.patch.object(NodeTraversal.objects, 'bulk_create', crash_on_fourth_batch):
+            resumed = gfa.to_graph(batch_size=100)
+        self.assertEqual(calls, [10, 10])  # only Paths y and z are written
+        self.assertEqual(resumed.pk, graph.pk)
+        self.assertEqual([p.nodes.count() for p in graph.paths.order_by('accession')], [10, 10, 10])
+        self.assertEqual(GraphGenome.objects.get(pk=graph.pk).fingerprint, gfa.fingerprint())
+
+    def test_placeholder_sequence(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.gfa') as f:
+            f.write('H\tVN:Z:1.0\nS\ts1\t*\tLN:i:5\nS\ts2\tACGT\nL\ts1\t+\ts2\t+\t0M\nP\tx\ts1+,s2+\t0M\n')
+            f.flush()
+            gfa = GFA.load_from_gfa(f.name)
+        graph = gfa.to_graph()
+        self.assertEqual(Node.objects.get(graph=graph, name='s1').seq, '')
+        self.assertEqual(graph.paths.get(accession='x').sequence(), 'ACGT')
+        self.assertEqual(gfa.fingerprint(), GraphGenome.objects.get(pk=graph.pk).fingerprint)
+
     def test_load_gfa_to_graph_2(self):
         gfa = GFA.load_from_gfa(join(PATH_TO_TEST_DATA, "test2.gfa"))
         graph = gfa.to_graph()
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('<int:graph_id>/window/', views.window, name='window'),
+    path('<int:graph_id>/gfa/', views.gfa, name='gfa'),
+    path('<int:graph_id>/nodes/', views.node_list, name='node_list'),
+    path('<int:graph_id>/fasta/', views.fasta, name='fasta'),
+]
@@ -1,5 +1,8 @@
 from collections import defaultdict
 
+ALIGNMENT = 8  # byte boundary of every array in the binary formats of Graph.shared and Graph.wire
+REVERSE = 1  # strand flag for '-', also the True of boolean strand arrays
+
 
 class keydefaultdict(defaultdict):
     def __missing__(self, key):
@@ -7,4 +10,9 @@ class keydefaultdict(defaultdict):
             raise KeyError( key )
         else:
             ret = self[key] = self.default_factory(key)
-            return ret
\ No newline at end of file
+            return ret
+
+
+def padded(size: int) -> int:
+    """size rounded up to the next multiple of ALIGNMENT"""
+    return -(-size // ALIGNMENT) * ALIGNMENT
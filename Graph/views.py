@@ -1,3 +1,183 @@
-from django.shortcuts import render
+import hashlib
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.paginator import Paginator, InvalidPage
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET
+
+from Graph import wire
+from Graph.cache import cached_tile, graph_generation
+from Graph.gfa import iter_gfa
+from Graph.models import GraphGenome, Node, NodeTraversal, Path
+from Graph.sequence import PackedSequence
 
 # View contains the endpoints on the server for the browser to fetch data
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 2000  # rows per database round trip in streamed downloads
+
+
+class WindowError(ValueError):
+    """Raised for malformed window requests.  Views report these as 400 Bad Request."""
+    pass
+
+
+def int_param(request, key, default=None):
+    value = request.GET.get(key, default)
+    if value is None:
+        raise WindowError(f"Missing parameter '{key}'")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise WindowError(f"Parameter '{key}' must be an integer, not {value!r}")
+
+
+def window_contents(reference: Path, rank_start: int, rank_end: int,
+                    page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> dict:
+    """Collects the Nodes visited by one page of steps [rank_start, rank_end) of the reference
+    Path, then every Path step that visits those Nodes, and the links implied by consecutive
+    steps.  Each query is bounded by the page size and served from the path/order and node
+    indexes, so latency does not grow with the size of the graph."""
+    graph = reference.graph_id
+    steps = reference.nodes.filter(order__gte=rank_start, order__lt=rank_end)
+    paginator = Paginator(steps.values_list('order', 'node_id', 'strand'), page_size)
+    current = paginator.page(page)
+    node_names = {node_id for _, node_id, _ in current}
+
+    nodes = [{'name': name, 'seq': str(PackedSequence(packed, length))} for name, packed, length in
+             Node.objects.filter(graph_id=graph, name__in=node_names).order_by('name').values_list(
+                 'name', 'packed', 'seq_length')]
+    paths = defaultdict(list)
+    for accession_visiting, order, node_id, strand in NodeTraversal.objects.filter(
+            path__graph_id=graph, path__zoom=reference.zoom, node_id__in=node_names).order_by('path_id', 'order').values_list(
+            'path__accession', 'order', 'node_id', 'strand'):
+        paths[accession_visiting].append([order, node_id, strand])
+    links = set()
+    for path_steps in paths.values():
+        for (order_a, node_a, strand_a), (order_b, node_b, strand_b) in zip(path_steps, path_steps[1:]):
+            if order_b == order_a + 1:
+                links.add((node_a, strand_a, node_b, strand_b))
+
+    return {'graph': graph,
+            'zoom': reference.zoom,
+            'path': reference.accession,
+            'rank_start': rank_start,
+            'rank_end': rank_end,
+            'page': current.number,
+            'pages': paginator.num_pages,
+            'page_size': page_size,
+            'nodes': nodes,
+            'links': sorted(links),
+            'paths': paths}
+
+
+def window_request(request, graph_id):
+    """Parses the window parameters shared by every window endpoint.
+    A window is given in steps of the reference Path with 'rank_start' and 'rank_end', or in
+    bp coordinates of the reference Path with 'start' and 'end'.  'zoom' selects the ZoomLevel."""
+    accession = request.GET.get('path')
+    if accession is None:
+        raise WindowError("Missing parameter 'path', the accession used as reference")
+    reference = get_object_or_404(Path, graph_id=graph_id, accession=accession,
+                                  zoom=int_param(request, 'zoom', 0))
+    if 'start' in request.GET or 'end' in request.GET:
+        rank_start, rank_end = reference.coordinates.step_range(int_param(request, 'start'),
+                                                                int_param(request, 'end'))
+    else:
+        rank_start = int_param(request, 'rank_start', 0)
+        rank_end = int_param(request, 'rank_end', rank_start + MAX_PAGE_SIZE)
+    page_size = int_param(request, 'page_size', DEFAULT_PAGE_SIZE)
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise WindowError(f"'page_size' must be between 1 and {MAX_PAGE_SIZE}")
+    return reference, rank_start, rank_end, int_param(request, 'page', 1), page_size
+
+
+def graph_etag(request, graph_id, *args, **kwargs):
+    """The tile cache generation changes whenever Nodes or steps of the graph change, so it can
+    tag responses with one small query.  Combined with the query string so every window has its
+    own tag."""
+    generation = graph_generation(graph_id)
+    if generation is None:  # the view answers 404
+        return None
+    state = f"{graph_id}:{generation}?{request.GET.urlencode()}"
+    return hashlib.sha1(state.encode()).hexdigest()
+
+
+@require_GET
+@condition(etag_func=graph_etag)
+def window(request, graph_id):
+    """JSON listing of the nodes, links and path steps inside a window of a GraphGenome.
+    With 'format=binary' the same window is sent in the typed array format of Graph.wire.
+    Supports conditional GET through ETag so a panning client only downloads changes.
+    Windows are served from the tile cache when the graph has not changed."""
+    try:
+        reference, rank_start, rank_end, page, page_size = window_request(request, graph_id)
+        key = (reference.accession, rank_start, rank_end, page, page_size)
+        build = lambda: window_contents(reference, rank_start, rank_end, page, page_size)
+        if request.GET.get('format') == 'binary':
+            body = cached_tile(graph_id, reference.zoom, key + ('binary',),
+                               lambda: wire.encode_window(cached_tile(graph_id, reference.zoom, key, build)))
+            return HttpResponse(body, content_type=wire.CONTENT_TYPE)
+        return JsonResponse(cached_tile(graph_id, reference.zoom, key, build))
+    except (WindowError, InvalidPage) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+def download(chunks, content_type: str, file_name: str = None) -> StreamingHttpResponse:
+    """Sends chunks as they are produced.  Combined with gzip_page, compression happens on the fly
+    too, so server memory stays flat however large the download is."""
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if file_name is not None:
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
+
+
+def node_list_chunks(graph: GraphGenome, zoom: int):
+    rows = Node.objects.filter(graph=graph, zoom=zoom).order_by('name').values_list(
+        'name', 'packed', 'seq_length').iterator(chunk_size=STREAM_CHUNK_SIZE)
+    separator = '['
+    for batch in iter(lambda: list(islice(rows, STREAM_CHUNK_SIZE)), []):
+        yield separator + ','.join(json.dumps({'name': name, 'seq': str(PackedSequence(packed, length))})
+                                   for name, packed, length in batch)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+@require_GET
+@gzip_page
+def gfa(request, graph_id):
+    """The whole graph, or the ZoomLevel given by 'zoom', as a GFA file"""
+    try:
+        graph = get_object_or_404(GraphGenome, pk=graph_id)
+        zoom = int_param(request, 'zoom', 0)
+    except WindowError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return download(iter_gfa(graph, zoom, STREAM_CHUNK_SIZE), 'text/plain', f"graph{graph_id}.gfa")
+
+
+@require_GET
+@gzip_page
+def node_list(request, graph_id):
+    """JSON list of every Node of the ZoomLevel given by 'zoom' with its sequence"""
+    try:
+        graph = get_object_or_404(GraphGenome, pk=graph_id)
+        zoom = int_param(request, 'zoom', 0)
+    except WindowError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return download(node_list_chunks(graph, zoom), 'application/json')
+
+
+@require_GET
+@gzip_page
+def fasta(request, graph_id):
+    """Genome of every full resolution Path, or only of the accession given by 'path', as FASTA"""
+    paths = get_object_or_404(GraphGenome, pk=graph_id).paths.order_by('accession')
+    if 'path' in request.GET:
+        get_object_or_404(paths, accession=request.GET['path'])
+        paths = paths.filter(accession=request.GET['path'])
+    return download((text for path in paths.iterator() for text in path.iter_fasta()),
+                    'text/plain', f"graph{graph_id}.fasta")
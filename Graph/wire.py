@@ -0,0 +1,127 @@
+"""
+Binary encoding of graph windows for the browser client.  JSON spends most of a window on
+repeated keys, quotes and decimal numbers and has to be parsed object by object.  The binary
+form is a fixed header followed by little endian typed arrays, each starting 8 byte aligned, so
+a client wraps every section in a TypedArray view of the response buffer without parsing it.
+
+Nodes are numbered by their position in the window's node list; links and steps refer to Nodes
+by that number.  Path membership is a bitset per Node with bit p (most significant first) set
+when Path p visits the Node, so thousands of specimens cost one bit each.  Strings are UTF-8
+byte sections with offset arrays, sequences are ASCII.
+"""
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+from Graph.utils import REVERSE, padded
+
+MAGIC = b'VGWN'
+VERSION = 1
+CONTENT_TYPE = 'application/vnd.vgbrowser.window'
+# magic, version, then graph, zoom, rank_start, rank_end, page, pages, page_size,
+# node count, link count, path count, step count, name bytes, sequence bytes, accession bytes,
+# reference accession bytes
+HEADER = struct.Struct('<4sI15q')
+FIELDS = ('graph', 'zoom', 'rank_start', 'rank_end', 'page', 'pages', 'page_size')
+
+
+def section_layout(nodes: int, links: int, paths: int, steps: int, name_bytes: int, seq_bytes: int,
+                   accession_bytes: int, reference_bytes: int) -> List[Tuple[str, np.dtype, tuple]]:
+    """Name, dtype and shape of each section in the order they follow the header"""
+    return [('name_offsets', np.dtype('<u4'), (nodes + 1,)),
+            ('seq_offsets', np.dtype('<u4'), (nodes + 1,)),
+            ('link_nodes', np.dtype('<u4'), (links, 2)),
+            ('link_strands', np.dtype('u1'), (links,)),  # REVERSE for the first Node, REVERSE << 1 for the second
+            ('accession_offsets', np.dtype('<u4'), (paths + 1,)),
+            ('membership', np.dtype('u1'), (nodes, (paths + 7) // 8)),
+            ('step_counts', np.dtype('<u4'), (paths,)),  # steps are grouped by Path in accession order
+            ('step_orders', np.dtype('<i4'), (steps,)),
+            ('step_nodes', np.dtype('<u4'), (steps,)),
+            ('step_strands', np.dtype('u1'), (steps,)),
+            ('names', np.dtype('u1'), (name_bytes,)),
+            ('sequences', np.dtype('u1'), (seq_bytes,)),
+            ('accessions', np.dtype('u1'), (accession_bytes,)),
+            ('reference', np.dtype('u1'), (reference_bytes,))]  # accession of the reference Path
+
+
+def string_section(strings: List[str], encoding: str = 'utf-8') -> Tuple[np.ndarray, bytes]:
+    encoded = [s.encode(encoding) for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+def encode_window(window: dict) -> bytes:
+    """Binary form of a window as built by Graph.views.window_contents()"""
+    nodes = window['nodes']
+    number = {node['name']: i for i, node in enumerate(nodes)}
+    name_offsets, names = string_section([node['name'] for node in nodes])
+    seq_offsets, sequences = string_section([node['seq'] for node in nodes], 'ascii')
+    accessions = sorted(window['paths'])
+    accession_offsets, accession_bytes = string_section(accessions)
+    reference = window['path'].encode()
+
+    links = np.array([(number[a], number[b]) for a, _, b, _ in window['links']], dtype=np.int64).reshape(-1, 2)
+    link_strands = [(strand_a == '-') * REVERSE | (strand_b == '-') * REVERSE << 1
+                    for _, strand_a, _, strand_b in window['links']]
+    steps = [step for accession in accessions for step in window['paths'][accession]]
+    step_counts = [len(window['paths'][accession]) for accession in accessions]
+    step_nodes = np.array([number[node] for _, node, _ in steps], dtype=np.int64)
+    step_paths = np.repeat(np.arange(len(accessions)), np.array(step_counts, dtype=np.int64))
+    membership = np.zeros((len(nodes), (len(accessions) + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(membership, (step_nodes, step_paths >> 3), (0x80 >> (step_paths & 7)).astype(np.uint8))
+
+    arrays = {'name_offsets': name_offsets, 'seq_offsets': seq_offsets,
+              'link_nodes': links, 'link_strands': link_strands,
+              'accession_offsets': accession_offsets, 'membership': membership,
+              'step_counts': step_counts, 'step_orders': [order for order, _, _ in steps],
+              'step_nodes': step_nodes, 'step_strands': [(strand == '-') * REVERSE for _, _, strand in steps],
+              'names': np.frombuffer(names, dtype=np.uint8), 'sequences': np.frombuffer(sequences, dtype=np.uint8),
+              'accessions': np.frombuffer(accession_bytes, dtype=np.uint8),
+              'reference': np.frombuffer(reference, dtype=np.uint8)}
+    counts = (len(nodes), len(links), len(accessions), len(steps), len(names), len(sequences), len(accession_bytes),
+              len(reference))
+    parts = [HEADER.pack(MAGIC, VERSION, *(window[field] for field in FIELDS), *counts)]
+    parts.append(bytes(padded(HEADER.size) - HEADER.size))
+    for name, dtype, shape in section_layout(*counts):
+        data = np.asarray(arrays[name]).astype(dtype, copy=False).reshape(shape).tobytes()
+        parts.append(data + bytes(padded(len(data)) - len(data)))
+    return b''.join(parts)
+
+
+def decode_sections(data: bytes) -> Tuple[dict, dict]:
+    """Header fields and zero copy views of every section, the way a client reads the format"""
+    magic, version, *values = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} window")
+    header = dict(zip(FIELDS, values))
+    counts = values[len(FIELDS):]
+    sections, offset = {}, padded(HEADER.size)
+    for name, dtype, shape in section_layout(*counts):
+        count = int(np.prod(shape))
+        sections[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += padded(count * dtype.itemsize)
+    return header, sections
+
+
+def decode_window(data: bytes) -> dict:
+    """Rebuilds the window dict from encode_window() output"""
+    window, sections = decode_sections(data)
+
+    def strings(offsets, raw, encoding='utf-8'):
+        raw = raw.tobytes()
+        return [raw[a:b].decode(encoding) for a, b in zip(offsets.tolist(), offsets.tolist()[1:])]
+    names = strings(sections['name_offsets'], sections['names'])
+    seqs = strings(sections['seq_offsets'], sections['sequences'], 'ascii')
+    accessions = strings(sections['accession_offsets'], sections['accessions'])
+    window['path'] = sections['reference'].tobytes().decode()
+    strand = {0: '+', REVERSE: '-'}
+    window['nodes'] = [{'name': name, 'seq': seq} for name, seq in zip(names, seqs)]
+    window['links'] = [(names[a], strand[flags & REVERSE], names[b], strand[flags >> 1 & REVERSE])
+                       for (a, b), flags in zip(sections['link_nodes'].tolist(), sections['link_strands'].tolist())]
+    steps = zip(sections['step_orders'].tolist(), sections['step_nodes'].tolist(), sections['step_strands'].tolist())
+    window['paths'] = {accession: [[order, names[node], strand[flags]] for order, node, flags in
+                                   (next(steps) for _ in range(count))]
+                       for accession, count in zip(accessions, sections['step_counts'].tolist())}
+    return window
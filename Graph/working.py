@@ -0,0 +1,186 @@
+"""
+In-memory working copy of one ZoomLevel of a GraphGenome for algorithms that read and edit a
+graph heavily.  Going through GraphGenome.paths and Path.nodes costs a query per access, and an
+algorithm touching every step that way issues one query per step.  WorkingGraph.load() reads the
+layer with one query per table into integer indexed arrays: Nodes and Paths are numbered in load
+order and the steps of each Path are arrays of Node numbers and strands.  Algorithms edit those,
+then save() compares them with what was loaded and writes only the difference in bulk.
+
+The working copy is not locked: writes to the same graph between load() and save() are
+overwritten where they overlap.
+"""
+from typing import Dict, List
+
+import numpy as np
+from django.db import connection, transaction
+
+from Graph.models import GraphGenome, Node, Path, NodeTraversal, node_item, step_item
+from Graph.sequence import canonical
+from Graph.utils import REVERSE
+
+
+class WorkingGraph:
+    """Nodes, Paths and steps of one ZoomLevel.  Node i is names[i] with seqs[i], Path p is
+    accessions[p] and visits the Nodes steps[p] in order with strands strands[p]."""
+    def __init__(self, graph: GraphGenome, zoom: int = 0):
+        self.graph = graph
+        self.zoom = zoom
+        self.names: List[str] = []
+        self.seqs: List[str] = []
+        self.node_index: Dict[str, int] = {}
+        self.deleted = set()  # Node numbers removed by delete_node()
+        self.accessions: List[str] = []
+        self.path_ids: List[int] = []  # database id, None for Paths added since load()
+        self.steps: List[np.ndarray] = []  # per Path, Node numbers
+        self.strands: List[np.ndarray] = []  # per Path, REVERSE for '-'
+        self._loaded = None
+
+    @classmethod
+    def load(cls, graph: GraphGenome, zoom: int = 0) -> 'WorkingGraph':
+        """Reads the layer with one query each for Nodes, Paths and steps"""
+        working = cls(graph, zoom)
+        for name, seq in ((node.name, node.seq) for node in
+                          Node.objects.filter(graph=graph, zoom=zoom).only('name', 'packed', 'seq_length').iterator()):
+            working.add_node(name, seq)
+        path_numbers = {}
+        for path_id, accession, step_count in Path.objects.filter(graph=graph, zoom=zoom).order_by('id').values_list(
+                'id', 'accession', 'step_count'):
+            path_numbers[path_id] = working.add_path(accession)
+            working.path_ids[-1] = path_id
+            working.steps[-1] = np.empty(step_count, dtype=np.int64)
+            working.strands[-1] = np.empty(step_count, dtype=bool)
+        filled = [0] * len(working.accessions)
+        for path_id, node_id, strand in NodeTraversal.objects.filter(path__graph=graph, path__zoom=zoom).order_by(
+                'path_id', 'order').values_list('path_id', 'node_id', 'strand').iterator(chunk_size=10000):
+            p = path_numbers[path_id]
+            if filled[p] == len(working.steps[p]):  # step_count behind the table, grow like a list
+                working.steps[p] = np.resize(working.steps[p], 2 * len(working.steps[p]) + 1)
+                working.strands[p] = np.resize(working.strands[p], len(working.steps[p]))
+            working.steps[p][filled[p]] = working.node_index[node_id]
+            working.strands[p][filled[p]] = REVERSE if strand == '-' else 0
+            filled[p] += 1
+        working.steps = [steps[:count] for steps, count in zip(working.steps, filled)]
+        working.strands = [strands[:count] for strands, count in zip(working.strands, filled)]
+        working.mark_saved()
+        return working
+
+    def __repr__(self):
+        return f"WorkingGraph of {self.graph.name} zoom {self.zoom}: " \
+               f"{len(self.names) - len(self.deleted)} nodes, {len(self.accessions)} paths"
+
+    def mark_saved(self):
+        """Remembers the current state as the one in the database"""
+        self._loaded = (len(self.names), list(self.seqs), set(self.deleted),
+                        [steps.copy() for steps in self.steps], [strands.copy() for strands in self.strands])
+
+    def add_node(self, name: str, seq: str = '') -> int:
+        if name in self.node_index:
+            raise ValueError(f"Node {name} already exists")
+        self.node_index[name] = len(self.names)
+        self.names.append(name)
+        self.seqs.append(seq)
+        return len(self.names) - 1
+
+    def delete_node(self, node: int) -> None:
+        """Removes a Node that no Path visits any more"""
+        if any((steps == node).any() for steps in self.steps):
+            raise ValueError(f"Node {self.names[node]} is still visited")
+        self.deleted.add(node)
+
+    def add_path(self, accession: str) -> int:
+        self.accessions.append(accession)
+        self.path_ids.append(None)
+        self.steps.append(np.empty(0, dtype=np.int64))
+        self.strands.append(np.empty(0, dtype=bool))
+        return len(self.accessions) - 1
+
+    def set_steps(self, path: int, nodes, strands=None) -> None:
+        """Replaces every step of a Path.  strands default to all '+'."""
+        self.steps[path] = np.asarray(nodes, dtype=np.int64)
+        self.strands[path] = np.zeros(len(self.steps[path]), dtype=bool) if strands is None else \
+            np.asarray(strands, dtype=bool)
+
+    def append_steps(self, path: int, nodes, strands=None) -> None:
+        nodes = np.asarray(nodes, dtype=np.int64)
+        strands = np.zeros(len(nodes), dtype=bool) if strands is None else np.asarray(strands, dtype=bool)
+        self.set_steps(path, np.concatenate([self.steps[path], nodes]), np.concatenate([self.strands[path], strands]))
+
+    def links(self) -> np.ndarray:
+        """Distinct (Node, next Node) pairs of consecutive steps as a links x 2 array"""
+        pairs = [np.stack([steps[:-1], steps[1:]], axis=1) for steps in self.steps if len(steps) > 1]
+        return np.unique(np.concatenate(pairs), axis=0) if pairs else np.empty((0, 2), dtype=np.int64)
+
+    def visits(self) -> np.ndarray:
+        """Number of steps on each Node"""
+        return np.bincount(np.concatenate(self.steps + [np.empty(0, dtype=np.int64)]), minlength=len(self.names))
+
+    def save(self) -> None:
+        """Writes what changed since load() or the last save() in one transaction.  Steps of a Path
+        are rewritten from the first one that differs, so appending only inserts.  Paths visiting a
+        Node whose sequence changed drop their coordinate index.  The fingerprint of a full
+        resolution graph is updated by the difference of the items that changed."""
+        from Graph.cache import invalidate_graph
+        node_count, seqs, deleted, steps, strands = self._loaded
+        strand_names = np.array(['+', '-'])
+        delta = 0
+        with transaction.atomic():
+            added = [i for i in range(node_count, len(self.names)) if i not in self.deleted]
+            changed = [i for i in range(node_count) if self.seqs[i] != seqs[i] and i not in self.deleted]
+            for i in added + changed:
+                self.seqs[i] = canonical(self.seqs[i])  # as stored and as the fingerprint reads it back
+            Node.objects.bulk_create([Node(name=self.names[i], seq=self.seqs[i], graph=self.graph, zoom=self.zoom)
+                                      for i in added])
+            Node.objects.bulk_update([Node(name=self.names[i], seq=self.seqs[i]) for i in changed],
+                                     ['packed', 'seq_length'], batch_size=10000)
+            removed = [i for i in self.deleted - deleted if i < node_count]
+            delta += sum(node_item(self.seqs[i]) for i in added + changed)
+            delta -= sum(node_item(seqs[i]) for i in changed + removed)
+            written = bool(added or changed or removed)
+            stale_coordinates = []
+            for p, accession in enumerate(self.accessions):
+                if self.path_ids[p] is None:
+                    path = Path(accession=accession, graph=self.graph, zoom=self.zoom)
+                    path.save()  # atomic with its fingerprint
+                    self.path_ids[p] = path.pk
+                    old_steps, old_strands = np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+                else:
+                    old_steps, old_strands = steps[p], strands[p]
+                common = min(len(old_steps), len(self.steps[p]))
+                differs = np.flatnonzero((old_steps[:common] != self.steps[p][:common]) |
+                                         (old_strands[:common] != self.strands[p][:common]))
+                first = int(differs[0]) if len(differs) else common
+                # unchanged steps on a changed Node keep their row but not their fingerprint item
+                resequenced = np.flatnonzero(np.isin(old_steps[:first], changed)).tolist()
+                if resequenced:
+                    stale_coordinates.append(self.path_ids[p])
+                delta += self.step_items(accession, resequenced, self.steps[p], self.strands[p], self.seqs)
+                delta -= self.step_items(accession, resequenced, old_steps, old_strands, seqs)
+                if first == len(old_steps) == len(self.steps[p]):
+                    continue
+                written = True
+                delta += self.step_items(accession, range(first, len(self.steps[p])), self.steps[p], self.strands[p], self.seqs)
+                delta -= self.step_items(accession, range(first, len(old_steps)), old_steps, old_strands, seqs)
+                with connection.cursor() as cursor:  # without loading every row for its delete signal
+                    cursor.execute(f'DELETE FROM "{NodeTraversal._meta.db_table}" WHERE path_id = %s AND "order" >= %s',
+                                   [self.path_ids[p], first])
+                names = [self.names[i] for i in self.steps[p][first:].tolist()]
+                signs = strand_names[self.strands[p][first:].astype(int)].tolist()
+                NodeTraversal.objects.bulk_create(
+                    [NodeTraversal(node_id=name, path_id=self.path_ids[p], strand=strand, order=order)
+                     for order, (name, strand) in enumerate(zip(names, signs), first)],
+                    batch_size=10000, force=True)
+                Path.objects.filter(pk=self.path_ids[p]).update(step_count=len(self.steps[p]), coordinates_blob=None)
+            if stale_coordinates:
+                Path.objects.filter(pk__in=stale_coordinates).update(coordinates_blob=None)
+            if removed:
+                Node.objects.filter(graph=self.graph, zoom=self.zoom, name__in=[self.names[i] for i in removed]).delete()
+            if written and self.zoom == 0:
+                GraphGenome.add_to_fingerprint(self.graph.pk, delta)
+        if written:
+            invalidate_graph(self.graph.pk)
+        self.mark_saved()
+
+    @staticmethod
+    def step_items(accession: str, orders, nodes: np.ndarray, strands: np.ndarray, seqs: List[str]) -> int:
+        """Sum of the fingerprint items of the steps at orders"""
+        return sum(step_item(accession, order, seqs[nodes[order]], '-' if strands[order] else '+') for order in orders)
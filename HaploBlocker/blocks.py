@@ -0,0 +1,63 @@
+"""
+Haplotype block statistics for the output of a HaploBlocker summarization.  Each Node left after
+split_groups() is a haplotype block: a run of windows shared by a group of specimens.  Specimen
+sets are read once into a specimens x blocks membership matrix and every statistic is computed
+from it with numpy.  All results are flat arrays, so pandas.DataFrame(stats.columns()) gives one
+row per block.
+"""
+from itertools import chain
+from typing import List, NamedTuple
+
+import numpy as np
+
+from HaploBlocker.haplonetwork import Node, BLOCK_SIZE
+
+
+class BlockStatistics(NamedTuple):
+    start: np.ndarray  # first window of each block
+    end: np.ndarray  # last window of each block, inclusive
+    windows: np.ndarray  # length in windows
+    snps: np.ndarray  # length in SNPs
+    specimen_count: np.ndarray
+    frequency: np.ndarray  # fraction of all specimens carrying the block
+    membership: np.ndarray  # bool specimens x blocks
+    coverage: np.ndarray  # per specimen, fraction of windows covered by some block
+
+    def columns(self) -> dict:
+        """One entry per block, ready for pandas.DataFrame"""
+        return {'start': self.start, 'end': self.end, 'windows': self.windows, 'snps': self.snps,
+                'specimen_count': self.specimen_count, 'frequency': self.frequency}
+
+
+def membership_matrix(nodes: List[Node], specimen_count: int = None) -> np.ndarray:
+    """Bool matrix with True where specimen (row) is part of block (column).  Specimens are
+    numbered as in build_individuals(), specimen_count defaults to the largest one seen."""
+    sizes = np.fromiter((len(node.specimens) for node in nodes), dtype=np.int64, count=len(nodes))
+    specimens = np.fromiter(chain.from_iterable(node.specimens for node in nodes), dtype=np.int64,
+                            count=int(sizes.sum()))
+    if specimen_count is None:
+        specimen_count = int(specimens.max()) + 1 if len(specimens) else 0
+    matrix = np.zeros((specimen_count, len(nodes)), dtype=bool)
+    matrix[specimens, np.repeat(np.arange(len(nodes)), sizes)] = True
+    return matrix
+
+
+def block_statistics(nodes: List[Node], specimen_count: int = None, block_size: int = BLOCK_SIZE) -> BlockStatistics:
+    """Length, specimen count and frequency of every block plus per specimen coverage,
+    in the order of nodes.  block_size is the number of SNPs per window."""
+    membership = membership_matrix(nodes, specimen_count)
+    start = np.fromiter((node.start for node in nodes), dtype=np.int64, count=len(nodes))
+    end = np.fromiter((node.end for node in nodes), dtype=np.int64, count=len(nodes))
+    windows = end - start + 1
+    counts = membership.sum(axis=0)
+    total_windows = int(end.max()) + 1 if len(end) else 0
+    # +1 where a block of the specimen starts and -1 after it ends, the running sum is the depth
+    depth = np.zeros((membership.shape[0], total_windows + 1), dtype=np.int32)
+    rows, blocks = np.nonzero(membership)
+    np.add.at(depth, (rows, start[blocks]), 1)
+    np.add.at(depth, (rows, end[blocks] + 1), -1)
+    covered = (np.cumsum(depth[:, :-1], axis=1) > 0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frequency = np.nan_to_num(counts / membership.shape[0])
+        coverage = np.nan_to_num(covered / total_windows)
+    return BlockStatistics(start, end, windows, windows * block_size, counts, frequency, membership, coverage)
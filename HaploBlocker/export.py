@@ -0,0 +1,86 @@
+"""
+Writes a summarized haplonetwork into the Graph database tables.  Every HaploBlocker Node becomes
+a Graph.models.Node and every specimen becomes a Path that traverses the Nodes covering it from
+the first window to the last.  Rows are derived from a node-index matrix with numpy and written
+with bulk_create in chunks, so no Django model is saved one at a time.
+HaploBlocker Nodes describe SNP windows, not nucleotides, so the exported Nodes have no sequence.
+"""
+from typing import List, Sequence
+
+import numpy as np
+from django.db import transaction
+
+from Graph.bulk import bulk_load
+from Graph.models import GraphGenome, Node, Path, NodeTraversal, node_item, path_item, step_item
+from HaploBlocker.haplonetwork import Node as HaploNode
+
+CHUNK_SIZE = 50000
+NO_NODE = -1
+
+
+def node_index_matrix(nodes: List[HaploNode], specimen_count: int, window_count: int) -> np.ndarray:
+    """specimens x windows matrix holding the index in nodes of the Node each specimen visits
+    in each window, or NO_NODE where it was pruned.  Node.end is inclusive."""
+    matrix = np.full((specimen_count, window_count), NO_NODE, dtype=np.int32)
+    for index, node in enumerate(nodes):
+        specimens = np.fromiter(node.specimens, dtype=np.int64, count=len(node.specimens))
+        matrix[specimens, node.start:node.end + 1] = index
+    return matrix
+
+
+def matrix_steps(matrix: np.ndarray):
+    """Steps of every specimen as three arrays (specimen, node index, order) in Path order.
+    A Node spanning several windows is one step, windows without a Node are skipped."""
+    entering = np.ones(matrix.shape, dtype=bool)
+    entering[:, 1:] = matrix[:, 1:] != matrix[:, :-1]
+    entering &= matrix != NO_NODE
+    specimens, windows = np.nonzero(entering)  # row major, so grouped by specimen in window order
+    counts = entering.sum(axis=1)
+    first_step = np.cumsum(counts) - counts
+    order = np.arange(len(specimens)) - np.repeat(first_step, counts)
+    return specimens, matrix[specimens, windows], order, counts
+
+
+def export_summary(nodes: List[HaploNode], name: str, specimen_names: Sequence[str] = None,
+                   zoom: int = 0, chunk_size: int = CHUNK_SIZE) -> GraphGenome:
+    """Creates a GraphGenome called name from the output of a HaploBlocker summarization such as
+    split_groups().  Specimens are numbered as in build_individuals() and are named by
+    specimen_names, or by their number.  The export runs in one transaction inside bulk_load(),
+    so a failure leaves no partial graph behind."""
+    from Graph.cache import invalidate_graph
+    specimen_count = 1 + max((max(node.specimens) for node in nodes if node.specimens), default=-1)
+    if specimen_names is None:
+        specimen_names = [str(i) for i in range(specimen_count)]
+    if len(specimen_names) < specimen_count:
+        raise ValueError(f"{specimen_count} specimens but only {len(specimen_names)} names")
+    window_count = 1 + max((node.end for node in nodes), default=-1)
+    matrix = node_index_matrix(nodes, len(specimen_names), window_count)
+    specimens, node_indices, orders, counts = matrix_steps(matrix)
+
+    with bulk_load(), transaction.atomic():
+        graph = GraphGenome.objects.create(name=name)
+        graph.zoom_level(zoom)
+        names = [f"{graph.pk}h{index}" for index in range(len(nodes))]
+        if names and len(names[-1]) > Node._meta.get_field('name').max_length:
+            raise ValueError(f"Node name {names[-1]} is too long for the database")
+        for start in range(0, len(nodes), chunk_size):
+            Node.objects.bulk_create([Node(seq='', name=node_name, graph=graph, zoom=zoom)
+                                      for node_name in names[start:start + chunk_size]])
+        Path.objects.bulk_create([Path(accession=accession, graph=graph, zoom=zoom, step_count=steps)
+                                  for accession, steps in zip(specimen_names, counts.tolist())],
+                                 batch_size=chunk_size)
+        path_ids = dict(graph.path_set.filter(zoom=zoom).values_list('accession', 'id'))
+        path_ids = [path_ids[accession] for accession in specimen_names]
+        for start in range(0, len(orders), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            NodeTraversal.objects.bulk_create(
+                [NodeTraversal(node_id=names[index], path_id=path_ids[specimen], strand='+', order=order)
+                 for specimen, index, order in zip(specimens[chunk].tolist(), node_indices[chunk].tolist(),
+                                                   orders[chunk].tolist())], force=True)
+        if zoom == 0:
+            total = len(nodes) * node_item('') + sum(path_item(accession) for accession in specimen_names)
+            total += sum(step_item(specimen_names[specimen], order, '', '+')
+                         for specimen, order in zip(specimens.tolist(), orders.tolist()))
+            GraphGenome.add_to_fingerprint(graph.pk, total)
+    invalidate_graph(graph.pk)
+    return graph
@@ -3,19 +3,86 @@ HaploBlocker handles Graph Summarization explained in:
 Graph Summarization: https://github.com/graph-genome/vgbrowser/issues/3
 HaploBlocker: https://github.com/graph-genome/vgbrowser/issues/19
 """
-from typing import List
+from typing import List, Tuple
 import numpy as np
 from collections import defaultdict
-from copy import copy
+from dataclasses import dataclass
 
 BLOCK_SIZE = 20
 FILTER_THRESHOLD = 4
+# Number of set bits in every byte value, numpy has no popcount
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
 
 
 def first(iterable):
     return next(iter(iterable))
 
 
+@dataclass(frozen=True)
+class PipelineConfig:
+    """Settings of one summarization run, the module constants are the defaults.
+    remainder decides what happens to loci after the last full window:
+    'discard' is the original behaviour, which drops the final window, full or not;
+    'keep' makes the remainder a short window of its own; 'merge' folds it into the last window.
+    Adaptive windows are used when max_block_size > block_size: consecutive windows are combined
+    while the combined window has at most low_diversity distinct signatures and max_block_size SNPs."""
+    block_size: int = BLOCK_SIZE
+    filter_threshold: int = FILTER_THRESHOLD
+    tolerance: int = 0  # see get_unique_signatures
+    remainder: str = 'discard'
+    max_block_size: int = 0
+    low_diversity: int = 2
+
+    def __post_init__(self):
+        if self.block_size < 1:
+            raise ValueError("block_size must be positive")
+        if self.remainder not in ('discard', 'keep', 'merge'):
+            raise ValueError(f"Unknown remainder handling {self.remainder!r}")
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_block_size > self.block_size
+
+    def windows(self, locus_count: int, individuals: np.ndarray = None) -> List[Tuple[int, int]]:
+        """[start, end) loci of every window.  individuals is required for adaptive windows."""
+        size = self.block_size
+        if self.remainder == 'discard':
+            bounds = [(start, start + size) for start in range(0, locus_count - size, size)]
+        else:
+            bounds = [(start, min(start + size, locus_count)) for start in range(0, locus_count, size)]
+            if self.remainder == 'merge' and len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < size:
+                bounds[-2:] = [(bounds[-2][0], locus_count)]
+        if self.adaptive and bounds:
+            bounds = self.combine_windows(bounds, individuals)
+        return bounds
+
+    def combine_windows(self, bounds, individuals: np.ndarray):
+        combined = [bounds[0]]
+        for start, end in bounds[1:]:
+            previous_start = combined[-1][0]
+            if end - previous_start <= self.max_block_size and \
+                    len(np.unique(individuals[:, previous_start:end], axis=0)) <= self.low_diversity:
+                combined[-1] = (previous_start, end)
+            else:
+                combined.append((start, end))
+        return combined
+
+
+class IdAllocator:
+    """Hands out Node.uid numbers for one graph.  A fresh allocator numbers Nodes in creation
+    order, so the same run gives the same ids (and hashes) in every process."""
+    def __init__(self, start: int = 0):
+        self.next_id = start
+
+    def __call__(self) -> int:
+        uid = self.next_id
+        self.next_id += 1
+        return uid
+
+
+DEFAULT_IDS = IdAllocator()  # for Nodes created without a graph, e.g. in tests
+
+
 class Node:
     """This definition of Node is designed to be equivalent to the R code HaploBlocker Nodes.
     This will be combined with the VG definition of Graph.models.Node and extended to support the
@@ -27,7 +94,9 @@ class Node:
     upstream or downstream nodes have been pruned.  The usage of Node.NOTHING is equivalent to
     our sequence mismatch penalties. In both cases information is being discarded for the
     purpose of summarization."""
-    def __init__(self, ident, start, end, specimens=None, upstream=None, downstream=None):
+    def __init__(self, ident, start, end, specimens=None, upstream=None, downstream=None, ids: IdAllocator = None):
+        self.ids = DEFAULT_IDS if ids is None else ids  # new Nodes derived from this one share the allocator
+        self.uid = self.ids()  # unique in the graph, unlike ident which counts within a window
         self.ident = ident
         self.start = start  # bp, arbitrary coordinates, used for debugging
         self.end = end  # bp, arbitrary coordinates, used for debugging
@@ -45,7 +114,7 @@ class Node:
         return "N%s(%s, %s)" % (str(self.ident), str(self.start), str(self.end))
 
     def __hash__(self):
-        return hash(self.ident + 1) * hash(self.start) * hash(self.end)
+        return self.uid
 
     def details(self):
         return f"""Node{self.ident}: {self.start} - {self.end}
@@ -86,7 +155,7 @@ class Node:
 # allele nodes, there will be specimens downstream that "come from" Node.NOTHING, meaning their
 # full history is no longer tracked.  Node.NOTHING is a regular exception case for missing data,
 # the ends of chromosomes, and the gaps between haplotype blocks.
-Node.NOTHING = Node(-1, None, None)
+Node.NOTHING = Node(-1, None, None, ids=IdAllocator(-1))
 
 
 def read_data(file_path):
@@ -102,46 +171,113 @@ def read_data(file_path):
     return loci, individuals
 
 
-def signature(individual, start_locus):
-    return tuple(individual[start_locus: start_locus + BLOCK_SIZE])
+def signature(individual, start_locus, end_locus=None):
+    end_locus = start_locus + BLOCK_SIZE if end_locus is None else end_locus
+    return tuple(individual[start_locus: end_locus])
 
 
-def get_unique_signatures(individuals, start_locus):
+def get_unique_signatures(individuals, start_locus, tolerance=0, end_locus=None, window=None,
+                          ids: IdAllocator = None):
     """A signature is a series of BLOCK_SIZE SNPs inside of a locus.  We want to know how many
     unique signatures are present inside of one locus.  A Node is created for each unique
     signature found.
     EX: Signature(1000001011013100200)
 
-    This method does not currently have error tolerance like R Haploblocker"""
+    With tolerance > 0, signatures that differ in at most tolerance SNPs from a more common
+    signature share its Node, like the error tolerance of R Haploblocker.  See tolerant_signatures.
+    end_locus and the window number default to fixed windows of BLOCK_SIZE.
+    ids is the IdAllocator of the graph, get_all_signatures shares one across windows."""
+    end_locus = start_locus + BLOCK_SIZE if end_locus is None else end_locus
+    window = start_locus // BLOCK_SIZE if window is None else window
+    ids = IdAllocator() if ids is None else ids
+    if tolerance:
+        return tolerant_signatures(np.asarray(individuals, dtype=np.uint8), start_locus, tolerance,
+                                   end_locus, window, ids)
     unique_blocks = {}
     for individual in individuals:
-        sig = signature(individual, start_locus)
+        sig = signature(individual, start_locus, end_locus)
         if sig not in unique_blocks:
-            unique_blocks[sig] = Node(len(unique_blocks),
-                                      start_locus // BLOCK_SIZE,
-                                      start_locus // BLOCK_SIZE)  # Inclusive end
+            unique_blocks[sig] = Node(len(unique_blocks), window, window, ids=ids)  # Inclusive end
     return unique_blocks
 
 
-def get_all_signatures(alleles, individuals):
+def pack_genotypes(block: np.ndarray) -> np.ndarray:
+    """Packs rows of genotypes 0-3 at 2 bits per SNP, 4 SNPs per byte."""
+    assert block.max(initial=0) < 4, "Genotypes must be 0, 1, 2 or 3"
+    padded = np.zeros((block.shape[0], -(-block.shape[1] // 4) * 4), dtype=np.uint8)
+    padded[:, :block.shape[1]] = block
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    return np.bitwise_or.reduce(padded.reshape(block.shape[0], -1, 4) << shifts, axis=2).astype(np.uint8)
+
+
+def hamming_distances(packed: np.ndarray, other: np.ndarray = None) -> np.ndarray:
+    """Number of differing SNPs between every row of packed and every row of other, both
+    pack_genotypes() output.  other defaults to packed itself.
+    A 2 bit SNP differs when either bit of the XOR is set."""
+    other = packed if other is None else other
+    xor = packed[:, None, :] ^ other[None, :, :]
+    return POPCOUNT[(xor | (xor >> 1)) & 0x55].sum(axis=2, dtype=np.int64)
+
+
+def tolerant_signatures(individuals: np.ndarray, start_locus, tolerance, end_locus, window, ids: IdAllocator):
+    """Clusters the signatures of one window greedily: the most common signature starts a Node and
+    every other signature joins the first Node within tolerance SNPs, or starts its own.
+    Returns every observed signature mapped to its Node, so build_individuals() works unchanged.
+    Nodes are numbered in order of first appearance like get_unique_signatures."""
+    block = individuals[:, start_locus: end_locus]
+    sigs, first_seen, counts = np.unique(block, axis=0, return_index=True, return_counts=True)
+    distances = hamming_distances(pack_genotypes(sigs))
+    cluster = np.full(len(sigs), -1)
+    centers = []
+    for i in np.lexsort((first_seen, -counts)):  # most common first, ties by first appearance
+        close = np.flatnonzero(distances[i, centers] <= tolerance)
+        if len(close):
+            cluster[i] = cluster[centers[close[0]]]
+        else:
+            cluster[i] = len(centers)
+            centers.append(i)
+    appearance = np.full(len(centers), len(individuals))
+    np.minimum.at(appearance, cluster, first_seen)
+    ident = np.argsort(np.argsort(appearance, kind='stable'), kind='stable')
+    nodes = [Node(i, window, window, ids=ids) for i in range(len(centers))]  # Inclusive end
+    return {tuple(sig): nodes[ident[c]] for sig, c in zip(sigs.tolist(), cluster.tolist())}
+
+
+def get_all_signatures(alleles, individuals, tolerance=0, config: PipelineConfig = None):
+    """Signature Nodes of every window.  Windows are laid out by config, which defaults to
+    BLOCK_SIZE windows with the given tolerance, see get_unique_signatures."""
+    config = PipelineConfig(tolerance=tolerance) if config is None else config
+    if config.tolerance or config.adaptive:
+        individuals = np.asarray(individuals, dtype=np.uint8)  # converted once, sliced per window
     unique_signatures = []
-    for locus_start in range(0, len(alleles) - BLOCK_SIZE, BLOCK_SIZE):  # discards remainder
-        sig = get_unique_signatures(individuals, locus_start)
+    ids = IdAllocator()
+    for window, (start, end) in enumerate(config.windows(len(alleles), individuals)):
+        sig = get_unique_signatures(individuals, start, config.tolerance, end, window, ids)
         unique_signatures.append(sig)
     return unique_signatures
 
 
+def window_starts(unique_signatures) -> List[int]:
+    """First locus of every window followed by the end of the last, from the signature lengths"""
+    starts = [0]
+    for window in unique_signatures:
+        starts.append(starts[-1] + (len(first(window)) if window else 0))
+    return starts
+
+
 def build_individuals(individuals, unique_signatures):
     """Describes an individual as a list of Nodes that individual visits.
     simplified_individuals is a list of loci which contain a list of Nodes which each contain specimen
     build nodes:  [0] first 4 are the 4 starting signatures in window 0.
     Nodes represent a collection of individuals with the same signature at that locus
-    For each node list which individuals are present at that node"""
+    For each node list which individuals are present at that node.
+    Window boundaries are the lengths of the signatures, so any PipelineConfig layout works."""
+    starts = window_starts(unique_signatures)
     simplified_individuals = []
     for i_specimen, specimen in enumerate(individuals):
         my_simplification = []
         for w, window in enumerate(unique_signatures):  # the length of the genome
-            sig = signature(specimen, w * BLOCK_SIZE)
+            sig = signature(specimen, starts[w], starts[w + 1])
             my_simplification.append(unique_signatures[w][sig])
         simplified_individuals.append(my_simplification)
     return simplified_individuals
@@ -151,21 +287,26 @@ def populate_transitions(simplified_individuals):
     """
     List transition rates from one node to all other upstream and downstream.
     This method populates Node.specimens and begins the process of side-effecting Nodes.
-    To rebuild a fresh Graph copy, you must start at get_all_signatures()
+    To rebuild a fresh Graph copy, start at get_all_signatures() or see HaploBlocker.incremental.copy_graph()
     :param simplified_individuals:
     """
     for i, indiv in enumerate(simplified_individuals):
-        # look what variants are present
-        for x, node in enumerate(indiv):
-            node.specimens.add(i)
-            if x + 1 < len(indiv):
-                node.downstream[indiv[x + 1]] += 1
-            else:
-                node.downstream[Node.NOTHING] += 1
-            if x - 1 >= 0:
-                node.upstream[indiv[x - 1]] += 1
-            else:
-                node.upstream[Node.NOTHING] += 1
+        add_transitions(i, indiv)
+
+
+def add_transitions(i, indiv):
+    """Adds specimen i, which visits the Nodes indiv, to Node.specimens and the transition counts"""
+    # look what variants are present
+    for x, node in enumerate(indiv):
+        node.specimens.add(i)
+        if x + 1 < len(indiv):
+            node.downstream[indiv[x + 1]] += 1
+        else:
+            node.downstream[Node.NOTHING] += 1
+        if x - 1 >= 0:
+            node.upstream[indiv[x - 1]] += 1
+        else:
+            node.upstream[Node.NOTHING] += 1
 
 
 def update_transition(node):
@@ -177,6 +318,12 @@ def update_transition(node):
     return node
 
 
+def shared_count(a: set, b: set) -> int:
+    """len(a & b) without building the intersection"""
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    return sum(map(large.__contains__, small))
+
+
 def update_stream_transitions(node, stream):
     """This will updated either upstream or downstream transition counts based on the
     the value of 'stream'.  This is a meta-programming function that requires the exact
@@ -186,7 +333,7 @@ def update_stream_transitions(node, stream):
     setattr(node, stream, defaultdict(lambda: 0))
     for n in running:
         if n is not Node.NOTHING:
-            g(node, stream)[n] = len(node.specimens.intersection(n.specimens))
+            g(node, stream)[n] = shared_count(node.specimens, n.specimens)
     accounted_upstream = sum(g(node, stream).values()) - g(node, stream)[Node.NOTHING]
     g(node, stream)[Node.NOTHING] = len(node.specimens) - accounted_upstream
     assert all([count > -1 for count in g(node, stream).values()]), node.details()
@@ -205,24 +352,32 @@ def simple_merge(full_graph):
     n = 0
     while n < len(full_graph):  # size of global_nodes changes, necessitating this weird loop
         node = full_graph[n]
-        if len(node.downstream) == 1:
-            next_node = first(node.downstream.keys())
-            if len(node.specimens) == len(next_node.specimens):
-                # Torsten deletes nodeA and modifies next_node
-                next_node.upstream = node.upstream
-                next_node.start = node.start
-                # prepare to delete node by removing references
-                for parent in node.upstream.keys():
-                    if parent is not Node.NOTHING:
-                        count = parent.downstream[node]
-                        del parent.downstream[node]  # updating pointer
-                        parent.downstream[next_node] = count
-                full_graph.remove(node)  # delete node
-                n -= 1
+        if merge_with_next(node):
+            full_graph.remove(node)  # delete node
+            n -= 1
         n += 1
     return full_graph
 
 
+def merge_with_next(node) -> bool:
+    """Merges node into its only downstream Node if they have the same specimens.
+    Returns True if node was merged and should be removed from the graph."""
+    if len(node.downstream) == 1:
+        next_node = first(node.downstream.keys())
+        if len(node.specimens) == len(next_node.specimens):
+            # Torsten deletes nodeA and modifies next_node
+            next_node.upstream = node.upstream
+            next_node.start = node.start
+            # prepare to delete node by removing references
+            for parent in node.upstream.keys():
+                if parent is not Node.NOTHING:
+                    count = parent.downstream[node]
+                    del parent.downstream[node]  # updating pointer
+                    parent.downstream[next_node] = count
+            return True
+    return False
+
+
 def delete_node(node, cutoff):
     """Changes references to this node to add to references to Node.NOTHING"""
     if cutoff < 1:
@@ -238,56 +393,73 @@ def delete_node(node, cutoff):
 def neglect_nodes(all_nodes, deletion_cutoff=FILTER_THRESHOLD):
     """Deletes nodes if they have too few specimens supporting them defined by
     :param deletion_cutoff
-    :returns a new list of nodes lacking the pruned nodes in all_nodes"""
-    nodes_to_delete = set()
-    for node in all_nodes:
-        if len(node.specimens) <= deletion_cutoff:
-            delete_node(node, deletion_cutoff)  # TODO: check if this will orphan
-            nodes_to_delete.add(node)
-    filtered_nodes = [x for x in all_nodes if x not in nodes_to_delete]
+    :returns a new list of nodes lacking the pruned nodes in all_nodes
+    Same result as delete_node() on every pruned Node, computed as one mask over the specimen
+    counts and one pass moving transitions to Node.NOTHING, see redirect_to_nothing()."""
+    counts = np.fromiter((len(node.specimens) for node in all_nodes), dtype=np.int64, count=len(all_nodes))
+    pruned = counts <= deletion_cutoff
+    if deletion_cutoff >= 1 and pruned.any():  # if cutoff is 0, then don't touch upstream and downstream
+        redirect_to_nothing([all_nodes[i] for i in np.flatnonzero(pruned)])  # TODO: check if this will orphan
+    filtered_nodes = [node for node, drop in zip(all_nodes, pruned.tolist()) if not drop]
     # TODO: remove orphaned haplotypes in a node that transition to and from zero within a 10 window length
     return filtered_nodes
 
 
+def redirect_to_nothing(deleted: List[Node]):
+    """Moves the transitions of every remaining neighbour to the deleted Nodes onto Node.NOTHING.
+    This is a single pass loop over the neighbours of the deleted Nodes, not a vectorized sweep.
+    Unlike repeated delete_node() calls, transitions of the deleted Nodes themselves and of
+    Node.NOTHING are left alone, nothing reads them afterwards."""
+    gone = set(deleted)
+    for node in deleted:
+        for stream, reverse in (('upstream', 'downstream'), ('downstream', 'upstream')):
+            for neighbour in getattr(node, stream):
+                if neighbour is Node.NOTHING or neighbour in gone:
+                    continue
+                transitions = getattr(neighbour, reverse)
+                transitions[Node.NOTHING] += transitions.pop(node, 0)  # delete_node() reads missing ones as 0
+
+
 def split_one_group(prev_node, anchor, next_node):
     """ Called when up.specimens == down.specimens
     Comment: That is actually the case we want to split up to obtain longer blocks later
     Extension of full windows will take care of potential loss of information later"""
-    my_specimens = copy(anchor.specimens)  # important to copy or side effects occur
-    if prev_node is not Node.NOTHING:  # normal case
-        my_specimens = my_specimens.intersection(prev_node.specimens)
-    if next_node is not Node.NOTHING:  # normal case
-        my_specimens = my_specimens.intersection(next_node.specimens)
-    if prev_node is Node.NOTHING and next_node is Node.NOTHING:  # exceptional: both are nothing node
-        my_specimens = copy(anchor.specimens)
+    # Only the new Node gets new containers.  Neighbour specimens are read in place and the new Node
+    # borrows the transitions dicts of its neighbours until update_transition() replaces them below.
+    if prev_node is not Node.NOTHING and next_node is not Node.NOTHING:  # normal case
+        smallest, middle, largest = sorted((prev_node.specimens, anchor.specimens, next_node.specimens), key=len)
+        my_specimens = {s for s in smallest if s in middle and s in largest}  # no intermediate set
+    elif prev_node is not Node.NOTHING or next_node is not Node.NOTHING:
+        my_specimens = anchor.specimens.intersection((next_node if prev_node is Node.NOTHING else prev_node).specimens)
+    else:  # exceptional: both are nothing node
+        my_specimens = set(anchor.specimens)
         # removing all specimens that transition to nothing
-        for n in anchor.downstream.keys():
-            if n is Node.NOTHING:  # remove dead leads
-                my_specimens -= n.specimens
-        for n in anchor.upstream.keys():
-            if n is Node.NOTHING:  # remove dead leads
-                my_specimens -= n.specimens
+        if Node.NOTHING in anchor.downstream:  # remove dead leads
+            my_specimens -= Node.NOTHING.specimens
+        if Node.NOTHING in anchor.upstream:  # remove dead leads
+            my_specimens -= Node.NOTHING.specimens
 
     my_start, my_end = prev_node.start, next_node.end
-    my_upstream, my_downstream = copy(prev_node.upstream), copy(next_node.downstream)
+    my_upstream, my_downstream = prev_node.upstream, next_node.downstream
     if Node.NOTHING is prev_node:  # Rare case
         my_start = anchor.start
-        my_upstream = copy(anchor.upstream)
+        my_upstream = anchor.upstream
     if Node.NOTHING is next_node:  # Rare case
         my_end = anchor.end
-        my_downstream = copy(anchor.downstream)
+        my_downstream = anchor.downstream
 
     # TODO: what about case where more content is joining downstream?
-    new = Node(777, my_start, my_end, my_specimens, my_upstream, my_downstream)
+    new = Node(777, my_start, my_end, my_specimens, my_upstream, my_downstream, ids=anchor.ids)
 
     # Update Specimens in prev_node, anchor, next_node
     anchor.specimens -= new.specimens
     prev_node.specimens -= new.specimens
     next_node.specimens -= new.specimens
 
-    # Update upstream/downstream
+    # Update upstream/downstream.  update_transition() always assigns fresh dicts, so every Node
+    # sharing a dict with new is among the suspects and no dict stays shared afterwards.
     update_neighbor_pointers(new)
-    suspects = {new, prev_node, anchor, next_node}.union(set(new.upstream.keys()), set(new.downstream.keys()))
+    suspects = {new, prev_node, anchor, next_node, *new.upstream.keys(), *new.downstream.keys()}
     for n in suspects:
         update_transition(n)
     new.validate()
@@ -317,27 +489,60 @@ def split_groups(all_nodes: List[Node]):
     the two new haplotype nodes."""
     new_graph = list(all_nodes)
     for node in all_nodes:
-        # check if all transition upstream match with one of my downstream nodes
-        if len(node.specimens) > 0:
-            # Matchup upstream and downstream with specimen identities
-            for up in tuple(node.upstream.keys()):
-                for down in tuple(node.downstream.keys()):
-                    set1 = copy(up.specimens)
-                    set2 = copy(down.specimens)
-                    if up is Node.NOTHING:
-                        set1 = copy(node.specimens)
-                        for index in tuple(node.upstream.keys()):
-                            if index is not Node.NOTHING:
-                                set1.difference_update(index.specimens)
-                    if down is Node.NOTHING:
-                        set2 = copy(node.specimens)
-                        for index in tuple(node.downstream.keys()):
-                            if index is not Node.NOTHING:
-                                set2.difference_update(index.specimens)
-
-                    if set1 == set2 and len(set1) > 0:
-                        new_node = split_one_group(up, node, down)
-                        new_graph.append(new_node)
+        new_graph.extend(split_anchor(node))
 
     filtered = neglect_nodes(new_graph, 0)  # Delete nodes with zero specimens from the Graph?
     return filtered
+
+
+def split_anchor(node) -> List[Node]:
+    """Splits node for every upstream and downstream pair that carry the same specimens
+    through it.  Returns the new Nodes."""
+    new_nodes = []
+    # check if all transition upstream match with one of my downstream nodes
+    if len(node.specimens) > 0:
+        # Matchup upstream and downstream with specimen identities
+        for up in tuple(node.upstream.keys()):
+            for down in tuple(node.downstream.keys()):
+                if carries_group(node, up, down):
+                    new_nodes.append(split_one_group(up, node, down))
+    return new_nodes
+
+
+def untracked(node, specimen, stream) -> bool:
+    """True if specimen does not come from (or go to) any Node in stream except Node.NOTHING"""
+    return not any(specimen in n.specimens for n in getattr(node, stream) if n is not Node.NOTHING)
+
+
+def carries_group(node, up, down) -> bool:
+    """True if the same non empty group of specimens comes from up and goes on to down.  For
+    Node.NOTHING the group is the specimens of node no other up or down Node accounts for.
+    Specimen sets are compared in place, nothing is copied."""
+    if up is not Node.NOTHING and down is not Node.NOTHING:
+        return len(up.specimens) > 0 and up.specimens == down.specimens
+    if up is Node.NOTHING and down is Node.NOTHING:
+        return any(untracked(node, s, 'upstream') for s in node.specimens) and \
+            all(untracked(node, s, 'upstream') == untracked(node, s, 'downstream') for s in node.specimens)
+    group, stream = (down, 'upstream') if up is Node.NOTHING else (up, 'downstream')
+    return len(group.specimens) > 0 and group.specimens <= node.specimens and \
+        all(untracked(node, s, stream) for s in group.specimens) and \
+        sum(untracked(node, s, stream) for s in node.specimens) == len(group.specimens)
+
+
+def summarize(alleles, individuals, config: PipelineConfig = None) -> List[Node]:
+    """Runs the whole summarization with one PipelineConfig and returns the remaining Nodes."""
+    config = PipelineConfig() if config is None else config
+    unique_signatures = get_all_signatures(alleles, individuals, config=config)
+    populate_transitions(build_individuals(individuals, unique_signatures))
+    # tolerant windows map several signatures to one Node
+    all_nodes = [node for window in unique_signatures for node in dict.fromkeys(window.values())]
+    return summarize_nodes(all_nodes, config)
+
+
+def summarize_nodes(nodes: List[Node], config: PipelineConfig = None) -> List[Node]:
+    """The merge, neglect and split passes of summarize() on nodes, which are side effected.
+    nodes is a whole graph, see HaploBlocker.incremental.summarize_copy() to keep the graph."""
+    config = PipelineConfig() if config is None else config
+    summary = simple_merge(nodes)
+    summary = neglect_nodes(summary, config.filter_threshold)
+    return split_groups(summary)
@@ -0,0 +1,93 @@
+"""
+Adds specimens to a HaploBlocker graph without rebuilding it.  A graph built by
+get_all_signatures(), build_individuals() and populate_transitions() is extended by looking up
+the signature Node of each new specimen in every window, creating Nodes for signatures never seen
+before, and adding the specimen's transitions.  The cost is proportional to the new specimens,
+the result is the same as building from scratch with all specimens.
+
+Only the unsummarized window graph is kept up to date.  The summary passes (simple_merge,
+neglect_nodes, split_groups) change the Nodes they run on, and merges and splits reach along
+whole haplotypes, so there is no step that re-summarizes part of a graph and splices it back
+into an existing summary.  summarize_copy() summarizes a copy_graph() copy instead, which leaves
+the window graph able to take more specimens.  Copying skips reading signatures again, but the
+summary itself costs as much as summarizing from scratch.  neighbourhood() reports which part of
+that summary can differ.
+"""
+from typing import List, Set, Tuple
+
+import numpy as np
+
+from HaploBlocker.haplonetwork import Node, IdAllocator, PipelineConfig, signature, window_starts, add_transitions, \
+    pack_genotypes, hamming_distances, summarize_nodes
+
+
+def closest_node(window: dict, sig: tuple, tolerance: int):
+    """Node of the first signature in window within tolerance SNPs of sig, or None"""
+    keys = list(window)
+    packed = pack_genotypes(np.array(keys + [sig], dtype=np.uint8))
+    distances = hamming_distances(packed[:-1], packed[-1:])[:, 0]
+    close = np.flatnonzero(distances <= tolerance)
+    return window[keys[close[0]]] if len(close) else None
+
+
+def add_specimens(unique_signatures: List[dict], simplified_individuals: List[List[Node]],
+                  new_individuals, tolerance: int = 0) -> Set[Node]:
+    """Appends new_individuals, genotype rows like read_data() returns, to an unsummarized graph.
+    simplified_individuals is extended in place and the new specimens are numbered after it.
+    With tolerance, an unseen signature joins the first Node within tolerance SNPs, which can
+    differ from the most-common-first clustering of get_unique_signatures.
+    Returns the Nodes visited by the new specimens."""
+    starts = window_starts(unique_signatures)
+    ids = next((node.ids for window in unique_signatures for node in window.values()), IdAllocator())
+    touched = set()
+    for specimen in new_individuals:
+        path = []
+        for w, window in enumerate(unique_signatures):
+            sig = signature(specimen, starts[w], starts[w + 1])
+            node = window.get(sig)
+            if node is None and tolerance and window:
+                node = closest_node(window, sig, tolerance)
+            if node is None:
+                node = Node(len(set(window.values())), w, w, ids=ids)  # Inclusive end
+            window[sig] = node
+            path.append(node)
+        add_transitions(len(simplified_individuals), path)
+        simplified_individuals.append(path)
+        touched.update(path)
+    return touched
+
+
+def copy_graph(unique_signatures: List[dict], simplified_individuals: List[List[Node]]) \
+        -> Tuple[List[dict], List[List[Node]]]:
+    """Copy of an unsummarized graph with its own Nodes, specimen sets and transitions, numbered by
+    a new IdAllocator.  One pass over the Nodes and their transitions."""
+    ids = IdAllocator()
+    copies = {}
+    for window in unique_signatures:
+        for node in window.values():
+            if node not in copies:
+                copies[node] = Node(node.ident, node.start, node.end, set(node.specimens), ids=ids)
+    copy = {Node.NOTHING: Node.NOTHING, **copies}
+    for node, twin in copies.items():
+        twin.upstream.update((copy[n], count) for n, count in node.upstream.items())
+        twin.downstream.update((copy[n], count) for n, count in node.downstream.items())
+    return [{sig: copies[node] for sig, node in window.items()} for window in unique_signatures], \
+        [[copies[node] for node in path] for path in simplified_individuals]
+
+
+def summarize_copy(unique_signatures: List[dict], simplified_individuals: List[List[Node]],
+                   config: PipelineConfig = None) -> List[Node]:
+    """summarize_nodes() of a copy_graph() copy, the graph itself can take more specimens after it"""
+    signatures, _ = copy_graph(unique_signatures, simplified_individuals)
+    return summarize_nodes([node for window in signatures for node in dict.fromkeys(window.values())], config)
+
+
+def neighbourhood(touched: Set[Node]) -> List[Node]:
+    """touched and their direct upstream and downstream Nodes in window order, the part of the
+    window graph where a summary can differ after touched Nodes changed.  Only for inspection,
+    summarizing just these Nodes does not give the summary of the whole graph."""
+    nodes = set(touched)
+    for node in touched:
+        nodes.update(node.upstream.keys(), node.downstream.keys())
+    nodes.discard(Node.NOTHING)
+    return sorted(nodes, key=lambda node: (node.start, node.end, node.ident))
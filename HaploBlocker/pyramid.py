@@ -0,0 +1,80 @@
+"""
+Signatures at several block sizes from one read of the genotypes, for zoomable summaries.
+The finest level is built from SNPs like get_all_signatures.  Every coarser window covers a whole
+number of finer windows and its signature is the tuple of the finer Node idents each specimen
+visits, so coarser levels are computed from the specimens x windows matrix of Node idents of the
+level below instead of from SNPs.
+"""
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+from HaploBlocker.haplonetwork import Node, IdAllocator, PipelineConfig, get_all_signatures
+
+PYRAMID_BLOCK_SIZES = (5, 20, 80, 320)
+
+
+class PyramidLevel(NamedTuple):
+    block_size: int  # SNPs per window
+    unique_signatures: List[dict]  # per window, signature -> Node, like get_all_signatures
+    node_ids: np.ndarray  # specimens x windows, ident of the Node each specimen visits
+
+    def simplified_individuals(self) -> List[List[Node]]:
+        """Same as build_individuals() for this level, ready for populate_transitions()"""
+        nodes = [{node.ident: node for node in window.values()} for window in self.unique_signatures]
+        return [[nodes[w][ident] for w, ident in enumerate(row)] for row in self.node_ids.tolist()]
+
+
+def first_appearance_ids(rows: np.ndarray):
+    """Numbers the distinct rows in order of first appearance, like get_unique_signatures.
+    Returns the distinct rows in that order and the number of every input row."""
+    distinct, first_seen, inverse = np.unique(rows, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first_seen, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return distinct[order], rank[inverse.reshape(-1)]
+
+
+def signature_ids(individuals: np.ndarray, unique_signatures: List[dict]) -> np.ndarray:
+    """specimens x windows matrix of Node idents for the finest level"""
+    ids = np.empty((len(individuals), len(unique_signatures)), dtype=np.int64)
+    start = 0
+    for w, window in enumerate(unique_signatures):
+        end = start + len(next(iter(window)))
+        distinct, inverse = np.unique(individuals[:, start:end], axis=0, return_inverse=True)
+        lookup = np.array([window[tuple(sig)].ident for sig in distinct.tolist()], dtype=np.int64)
+        ids[:, w] = lookup[inverse.reshape(-1)]
+        start = end
+    return ids
+
+
+def coarser_level(finer: PyramidLevel, block_size: int, keep_remainder: bool) -> PyramidLevel:
+    factor = block_size // finer.block_size
+    window_count = finer.node_ids.shape[1] // factor + (keep_remainder and finer.node_ids.shape[1] % factor > 0)
+    ids = np.empty((finer.node_ids.shape[0], window_count), dtype=np.int64)
+    unique_signatures = []
+    allocator = IdAllocator()  # every level is a graph of its own
+    for w in range(window_count):
+        distinct, ids[:, w] = first_appearance_ids(finer.node_ids[:, w * factor:(w + 1) * factor])
+        unique_signatures.append({tuple(sig): Node(ident, w, w, ids=allocator)  # Inclusive end
+                                  for ident, sig in enumerate(distinct.tolist())})
+    return PyramidLevel(block_size, unique_signatures, ids)
+
+
+def build_pyramid(alleles, individuals, block_sizes: Sequence[int] = PYRAMID_BLOCK_SIZES,
+                  config: PipelineConfig = None) -> List[PyramidLevel]:
+    """One PyramidLevel per block size, finest first.  Each block size must be a multiple of the
+    one before.  config applies to the finest level, its block_size is replaced by block_sizes[0].
+    Coarse windows that are not complete at the end are kept unless config.remainder is 'discard'."""
+    config = PipelineConfig() if config is None else config
+    if config.adaptive:
+        raise ValueError("Adaptive windows can not be nested into a pyramid")
+    if any(coarse % fine for fine, coarse in zip(block_sizes, block_sizes[1:])):
+        raise ValueError(f"Each block size must be a multiple of the previous: {block_sizes}")
+    finest = PipelineConfig(block_sizes[0], config.filter_threshold, config.tolerance, config.remainder)
+    unique_signatures = get_all_signatures(alleles, individuals, config=finest)
+    ids = signature_ids(np.asarray(individuals, dtype=np.uint8), unique_signatures)
+    levels = [PyramidLevel(block_sizes[0], unique_signatures, ids)]
+    for block_size in block_sizes[1:]:
+        levels.append(coarser_level(levels[-1], block_size, config.remainder != 'discard'))
+    return levels
@@ -0,0 +1,105 @@
+"""
+Summarization passes as generators over Nodes in window order.  The haplonetwork is nearly linear
+in locus order, so a pass only ever changes Nodes close to the one it is processing.  Each stage
+holds back the Nodes it has output until everything they could still be changed by has been
+processed, and only that sliding window of Nodes is kept in memory.
+
+A stage processing a Node changes its neighbours up to a few transitions downstream, its reach.
+A Node is released once every Node within lookahead transitions downstream has been processed,
+which must be at least the reach of the stage plus the reach of the stage consuming its output.
+"""
+from collections import deque
+from typing import Iterable, Iterator
+
+from HaploBlocker.haplonetwork import Node, PipelineConfig, merge_with_next, delete_node, split_anchor
+
+MERGE_REACH = 1  # merging changes the upstream Nodes and the Node merged into
+NEGLECT_REACH = 1  # deleting changes the upstream and downstream Nodes
+SPLIT_REACH = 2  # splitting changes up, down and the neighbours of both
+
+
+class Settler:
+    """Holds the output of a stage until no Node still to be processed can change it.
+    Output keeps the order Nodes were added in."""
+    def __init__(self, lookahead: int):
+        self.lookahead = lookahead
+        self.processed = {}  # Node: sequence number, in processing order
+        self.pending = deque()
+        self.count = 0
+
+    def add(self, node: Node, output: bool = True):
+        """Marks node as processed, output=False for Nodes the stage removed"""
+        self.processed[node] = self.count
+        self.count += 1
+        if output:
+            self.pending.append(node)
+
+    def settled(self, node: Node) -> bool:
+        frontier = [node]
+        for _ in range(self.lookahead):
+            frontier = [n for f in frontier for n in f.downstream if n is not Node.NOTHING]
+            if any(n not in self.processed for n in frontier):
+                return False
+        return True
+
+    def release(self) -> Iterator[Node]:
+        while self.pending and self.settled(self.pending[0]):
+            yield self.pending.popleft()
+        # Nodes processed before the oldest pending Node are downstream of nothing still held.
+        # Forgetting one that is would only delay the Node holding it until flush().
+        oldest = self.processed[self.pending[0]] if self.pending else float('inf')
+        while self.processed and next(iter(self.processed.values())) < oldest:
+            del self.processed[next(iter(self.processed))]
+
+    def flush(self) -> Iterator[Node]:
+        yield from self.pending
+        self.pending.clear()
+        self.processed.clear()
+
+
+def stream_simple_merge(nodes: Iterable[Node], lookahead: int = MERGE_REACH) -> Iterator[Node]:
+    """simple_merge() as a generator"""
+    settler = Settler(lookahead)
+    for node in nodes:
+        if not merge_with_next(node):  # merged Nodes are no longer referenced
+            settler.add(node)
+        yield from settler.release()
+    yield from settler.flush()
+
+
+def stream_neglect_nodes(nodes: Iterable[Node], deletion_cutoff: int, lookahead: int = NEGLECT_REACH) -> Iterator[Node]:
+    """neglect_nodes() as a generator"""
+    settler = Settler(lookahead)
+    for node in nodes:
+        if len(node.specimens) > deletion_cutoff:
+            settler.add(node)
+        else:
+            delete_node(node, deletion_cutoff)
+            if deletion_cutoff < 1:  # still referenced by its neighbours
+                settler.add(node, output=False)
+        yield from settler.release()
+    yield from settler.flush()
+
+
+def stream_split_groups(nodes: Iterable[Node], lookahead: int = SPLIT_REACH) -> Iterator[Node]:
+    """split_groups() as a generator.  New Nodes are output near their anchor instead of at the end."""
+    settler = Settler(lookahead)
+
+    def non_empty(released):
+        return (node for node in released if len(node.specimens) > 0)
+
+    for node in nodes:
+        settler.add(node)
+        for new_node in split_anchor(node):
+            settler.add(new_node)  # never an anchor itself
+        yield from non_empty(settler.release())
+    yield from non_empty(settler.flush())
+
+
+def stream_summarize_nodes(nodes: Iterable[Node], config: PipelineConfig = None) -> Iterator[Node]:
+    """summarize_nodes() as a pipeline of streaming stages.  Yields the same Nodes, not
+    necessarily in the same order."""
+    config = PipelineConfig() if config is None else config
+    merged = stream_simple_merge(nodes, MERGE_REACH + NEGLECT_REACH)
+    neglected = stream_neglect_nodes(merged, config.filter_threshold, NEGLECT_REACH + SPLIT_REACH)
+    return stream_split_groups(neglected)
@@ -1,12 +1,25 @@
 from django.test import TestCase
+from django.urls import reverse
 from vgbrowser.settings import BASE_DIR
 import unittest
 import os
+import sys
+import tempfile
+import tracemalloc
+import numpy as np
+from unittest import mock
 # Create your tests here.
 # from HaploBlocker.models import Node, Path, Edge
-from HaploBlocker.haplonetwork import Node, split_one_group
+from HaploBlocker.haplonetwork import Node, split_one_group, split_anchor, delete_node
 from HaploBlocker.haplonetwork import read_data, get_all_signatures, build_individuals, get_unique_signatures, \
-    populate_transitions, simple_merge, neglect_nodes, split_groups
+    populate_transitions, simple_merge, neglect_nodes, split_groups, PipelineConfig, summarize, summarize_nodes
+from HaploBlocker.blocks import block_statistics
+from HaploBlocker.export import export_summary
+from HaploBlocker.pyramid import build_pyramid
+from HaploBlocker.incremental import add_specimens, neighbourhood, summarize_copy
+from HaploBlocker.streaming import stream_summarize_nodes
+from Graph.gfa import GFA
+from Graph.models import GraphGenome
 
 #
 # class ModelTest(TestCase):
@@ -19,6 +32,36 @@ from HaploBlocker.haplonetwork import read_data, get_all_signatures, build_indiv
 #         print(Edge.objects.all())
 
 
+def unsplit_allocation_peaks(nodes):
+    """Peak bytes allocated by split_anchor() for each anchor that is not split"""
+    peaks = []
+    for node in nodes:
+        tracemalloc.start()
+        new_nodes = split_anchor(node)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if not new_nodes:
+            peaks.append(peak)
+    return peaks
+
+
+def split_allocations(nodes):
+    """For every split_one_group() call of split_groups(nodes), the bytes it allocated and freed
+    again before returning, and the size of the new Node's specimen set"""
+    allocations = []
+
+    def measured(*args):
+        tracemalloc.start()
+        new = split_one_group(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocations.append((peak - current, sys.getsizeof(new.specimens)))
+        return new
+    with mock.patch('HaploBlocker.haplonetwork.split_one_group', measured):
+        split_groups(nodes)
+    return allocations
+
+
 class HaploTest(unittest.TestCase):
     @classmethod
     def setUpClass(self) -> None:
@@ -163,5 +206,251 @@ class HaploTest(unittest.TestCase):
         # test3 = split_groups(test2)
 
 
+class TolerantSignatureTest(unittest.TestCase):
+    """get_unique_signatures() with and without a mismatch tolerance"""
+    def setUp(self):
+        common = [0, 2] * 10
+        typo = list(common)
+        typo[5] = 0  # one SNP error
+        other = [2, 0] * 10
+        self.individuals = [other, common, common, typo, common, other]  # one window of 20 SNPs
+
+    def test_exact_by_default(self):
+        exact = get_unique_signatures(self.individuals, 0)
+        self.assertEqual(len(set(exact.values())), 3)
+        self.assertEqual(repr(get_unique_signatures(self.individuals, 0, tolerance=0)), repr(exact))
+
+    def test_tolerance_merges_close_signatures(self):
+        tolerant = get_unique_signatures(self.individuals, 0, tolerance=1)
+        self.assertEqual(len(tolerant), 3)  # every observed signature is still a key
+        self.assertIs(tolerant[tuple(self.individuals[3])], tolerant[tuple(self.individuals[1])])
+        self.assertEqual(tolerant[tuple(self.individuals[0])].ident, 0)  # numbered by first appearance
+        self.assertEqual(tolerant[tuple(self.individuals[1])].ident, 1)
+        individuals = build_individuals(self.individuals, [tolerant])
+        self.assertEqual([path[0].ident for path in individuals], [0, 1, 1, 1, 1, 0])
+
+
+class PipelineConfigTest(unittest.TestCase):
+    """Window layout of PipelineConfig and summarize() under different configurations"""
+    def test_remainder(self):
+        self.assertEqual(PipelineConfig().windows(45), [(0, 20), (20, 40)])
+        self.assertEqual(PipelineConfig().windows(40), [(0, 20)])  # original behaviour
+        self.assertEqual(PipelineConfig(remainder='keep').windows(45), [(0, 20), (20, 40), (40, 45)])
+        self.assertEqual(PipelineConfig(remainder='merge').windows(45), [(0, 20), (20, 45)])
+        self.assertEqual(PipelineConfig(block_size=5, remainder='keep').windows(12), [(0, 5), (5, 10), (10, 12)])
+        with self.assertRaises(ValueError):
+            PipelineConfig(remainder='pad')
+
+    def test_adaptive_windows(self):
+        rng = np.random.RandomState(0)
+        haplotypes = rng.randint(0, 2, (3, 60)) * 2
+        haplotypes[:, :30] = 0  # no diversity in the first half
+        individuals = haplotypes[np.arange(12) % 3]
+        config = PipelineConfig(block_size=10, max_block_size=40, remainder='keep')
+        self.assertEqual(config.windows(60, individuals), [(0, 30), (30, 40), (40, 50), (50, 60)])
+        signatures = get_all_signatures(range(60), individuals.tolist(), config=config)
+        self.assertEqual([len(window) for window in signatures], [1, 3, 3, 3])
+        paths = build_individuals(individuals.tolist(), signatures)
+        self.assertEqual(paths[4][1], signatures[1][tuple(haplotypes[1, 30:40])])
+
+    def test_two_configurations(self):
+        rng = np.random.RandomState(1)
+        individuals = (rng.randint(0, 2, (4, 100)) * 2)[np.arange(40) % 4].tolist()
+        fine = summarize(range(100), individuals, PipelineConfig(block_size=10, remainder='keep'))
+        coarse = summarize(range(100), individuals, PipelineConfig(block_size=50, remainder='keep'))
+        self.assertEqual(len(fine), 4)  # one block per haplotype
+        self.assertEqual([n.end for n in fine], [9] * 4)
+        self.assertEqual([n.end for n in coarse], [1] * 4)
+
+
+class PyramidTest(unittest.TestCase):
+    """build_pyramid() levels against running each block size from scratch"""
+    def test_levels_match_direct_signatures(self):
+        rng = np.random.RandomState(2)
+        individuals = (rng.randint(0, 2, (6, 170)) * 2)[rng.randint(0, 6, 30)].tolist()
+        config = PipelineConfig(remainder='keep')
+        levels = build_pyramid(range(170), individuals, (5, 20, 80), config)
+        self.assertEqual([level.node_ids.shape for level in levels], [(30, 34), (30, 9), (30, 3)])
+        for level in levels:  # same Nodes as running each block size from scratch
+            direct = get_all_signatures(range(170), individuals, config=PipelineConfig(level.block_size,
+                                                                                       remainder='keep'))
+            self.assertEqual([len(window) for window in level.unique_signatures],
+                             [len(window) for window in direct])
+            expected = build_individuals(individuals, direct)
+            self.assertEqual([[n.ident for n in path] for path in level.simplified_individuals()],
+                             [[n.ident for n in path] for path in expected])
+
+    def test_block_sizes_must_nest(self):
+        with self.assertRaises(ValueError):
+            build_pyramid(range(100), [[0] * 100], (5, 20, 30))
+
+
+class IncrementalTest(unittest.TestCase):
+    """add_specimens() against building the graph with every specimen at once"""
+    def build(self, individuals):
+        signatures = get_all_signatures(range(100), individuals)
+        simplified = build_individuals(individuals, signatures)
+        populate_transitions(simplified)
+        return signatures, simplified
+
+    def state(self, signatures):
+        def key(node):
+            return None if node is Node.NOTHING else (node.start, node.ident)
+        return [{sig: (node.ident, sorted(node.specimens), sorted((key(n), c) for n, c in node.upstream.items()),
+                       sorted((key(n), c) for n, c in node.downstream.items()))
+                 for sig, node in window.items()} for window in signatures]
+
+    def test_matches_full_build(self):
+        rng = np.random.RandomState(3)
+        haplotypes = rng.randint(0, 2, (5, 100)) * 2
+        individuals = haplotypes[rng.randint(0, 5, 20)].tolist()
+        individuals[19][50] = 2 - individuals[19][50]  # a signature only the last specimen has
+        signatures, simplified = self.build(individuals[:15])
+        touched = add_specimens(signatures, simplified, individuals[15:])
+        self.assertEqual(len(simplified), 20)
+        self.assertEqual(self.state(signatures), self.state(self.build(individuals)[0]))
+        self.assertTrue(all(node.specimens & set(range(15, 20)) for node in touched))
+        self.assertTrue(touched.issubset(neighbourhood(touched)))
+
+    def test_summarize_copy(self):
+        rng = np.random.RandomState(4)
+        haplotypes = rng.randint(0, 2, (4, 100)) * 2
+        individuals = haplotypes[rng.randint(0, 4, 40)].tolist()
+        signatures, simplified = self.build(individuals[:30])
+        before = self.state(signatures)
+        summary = summarize_copy(signatures, simplified)
+        self.assertEqual(self.state(signatures), before)  # the window graph is untouched
+        expected = summarize(range(100), individuals[:30])
+        self.assertEqual(sorted((n.start, n.end, sorted(n.specimens)) for n in summary),
+                         sorted((n.start, n.end, sorted(n.specimens)) for n in expected))
+        add_specimens(signatures, simplified, individuals[30:])
+        self.assertEqual(self.state(signatures), self.state(self.build(individuals)[0]))
+
+
+def synthetic_individuals(seed, specimens=80, loci=2000):
+    """Six haplotypes with one recombination per specimen and 0.2% genotype errors"""
+    rng = np.random.RandomState(seed)
+    haplotypes = rng.randint(0, 2, (6, loci)) * 2
+    individuals = haplotypes[rng.randint(0, 6, specimens)]
+    for specimen, crossover in enumerate(rng.randint(0, loci, specimens)):
+        individuals[specimen, crossover:] = haplotypes[rng.randint(0, 6), crossover:]
+    errors = rng.rand(specimens, loci) < 0.002
+    individuals[errors] = 2 - individuals[errors]
+    return individuals.tolist()
+
+
+def raw_nodes(individuals):
+    """Unsummarized Nodes of individuals in window order, with their transitions populated"""
+    signatures = get_all_signatures(individuals[0], individuals)
+    populate_transitions(build_individuals(individuals, signatures))
+    return [node for window in signatures for node in window.values()]
+
+
+class StreamingTest(unittest.TestCase):
+    def test_same_nodes_as_lists(self):
+        individuals = synthetic_individuals(0)
+        listed = summarize_nodes(raw_nodes(individuals))
+        streamed = list(stream_summarize_nodes(iter(raw_nodes(individuals))))
+        def key(nodes):
+            return sorted((node.start, node.end, sorted(node.specimens)) for node in nodes)
+        self.assertGreater(len(listed), 100)
+        self.assertEqual(key(streamed), key(listed))
+
+
+class NeglectTest(unittest.TestCase):
+    def merged_nodes(self):
+        return simple_merge(raw_nodes(synthetic_individuals(1)))
+
+    def transitions(self, nodes):
+        def key(node):
+            return None if node is Node.NOTHING else (node.start, node.end, node.ident)
+        return [(key(node), [(key(n), c) for n, c in node.upstream.items()],
+                 [(key(n), c) for n, c in node.downstream.items()]) for node in nodes]
+
+    def test_same_as_delete_node(self):
+        for cutoff in (0, 4):
+            expected = self.merged_nodes()
+            for node in expected:
+                if len(node.specimens) <= cutoff:
+                    delete_node(node, cutoff)
+            expected = [node for node in expected if len(node.specimens) > cutoff]
+            pruned = neglect_nodes(self.merged_nodes(), cutoff)
+            self.assertEqual(self.transitions(pruned), self.transitions(expected))
+        self.assertLess(len(pruned), len(self.merged_nodes()))
+
+
+class SplitAllocationTest(unittest.TestCase):
+    def test_split_anchor_does_not_copy(self):
+        nodes = neglect_nodes(simple_merge(raw_nodes(synthetic_individuals(0, specimens=400))))
+        peaks = unsplit_allocation_peaks(nodes)
+        self.assertGreater(len(peaks), 100)
+        self.assertLess(max(peaks), 2048)  # a copy of one set of 400 specimens is larger
+
+    def test_split_one_group_does_not_copy(self):
+        rng = np.random.RandomState(5)
+        haplotypes = rng.randint(0, 2, (4, 400)) * 2
+        for start in range(20, 400, 40):
+            haplotypes[:, start:start + 20] = haplotypes[0, start:start + 20]  # anchors every haplotype shares
+        nodes = neglect_nodes(simple_merge(raw_nodes(haplotypes[np.arange(400) % 4].tolist())))
+        allocations = split_allocations(nodes)
+        self.assertGreater(len(allocations), 10)
+        for temporary, kept in allocations:
+            # the new specimen set is the intersection of the others, so a copy of any is at least as large
+            self.assertLess(temporary, kept / 2)
+
+
+class NodeIdentityTest(unittest.TestCase):
+    def summary(self):
+        raw = raw_nodes(synthetic_individuals(2))
+        self.assertEqual([node.uid for node in raw], list(range(len(raw))))
+        return raw[0].ids, summarize_nodes(raw)
+
+    def test_uids_are_unique_and_reproducible(self):
+        ids, nodes = self.summary()
+        self.assertEqual(len({node.uid for node in nodes}), len(nodes))
+        self.assertTrue(all(hash(node) == node.uid for node in nodes))
+        self.assertTrue(all(node.ids is ids for node in nodes))  # split Nodes share the allocator
+        self.assertEqual([node.uid for node in self.summary()[1]], [node.uid for node in nodes])
+
+
+class BlockStatisticsTest(unittest.TestCase):
+    def test_block_statistics(self):
+        nodes = [Node(0, 0, 0, {0, 1, 2, 3}),
+                 Node(1, 1, 2, {0, 1}),
+                 Node(2, 1, 1, {2}),
+                 Node(3, 2, 2, {2, 3})]  # specimen 3 was pruned in window 1
+        stats = block_statistics(nodes)
+        self.assertEqual(stats.windows.tolist(), [1, 2, 1, 1])
+        self.assertEqual(stats.snps.tolist(), [20, 40, 20, 20])
+        self.assertEqual(stats.specimen_count.tolist(), [4, 2, 1, 2])
+        self.assertEqual(stats.frequency.tolist(), [1.0, 0.5, 0.25, 0.5])
+        self.assertEqual(stats.membership.astype(int).tolist(), [[1, 1, 0, 0], [1, 1, 0, 0],
+                                                                 [1, 0, 1, 1], [1, 0, 0, 1]])
+        self.assertEqual(stats.coverage.tolist(), [1.0, 1.0, 1.0, 2 / 3])
+        self.assertEqual(set(stats.columns()), {'start', 'end', 'windows', 'snps', 'specimen_count', 'frequency'})
+
 
+class ExportTest(TestCase):
+    """Exports a small hand made summary to the Graph tables.  Does not need KE data."""
+    def test_export_summary(self):
+        nodes = [Node(0, 0, 0, {0, 1, 2, 3}),
+                 Node(1, 1, 2, {0, 1}),  # spans two windows
+                 Node(2, 1, 1, {2}),
+                 Node(3, 2, 2, {2, 3})]  # specimen 3 was pruned in window 1
+        graph = export_summary(nodes, 'haplo', ['w', 'x', 'y', 'z'], chunk_size=2)
+        steps = {path.accession: [t.node.name for t in path.nodes] for path in graph.paths}
+        n = [f"{graph.pk}h{i}" for i in range(4)]
+        self.assertEqual(steps, {'w': [n[0], n[1]], 'x': [n[0], n[1]], 'y': [n[0], n[2], n[3]], 'z': [n[0], n[3]]})
+        self.assertEqual([p.step_count for p in graph.paths.order_by('accession')], [2, 2, 3, 2])
+        stored = GraphGenome.objects.get(pk=graph.pk).fingerprint
+        self.assertEqual(graph.rebuild_fingerprint(), stored)
 
+    def test_download_round_trip(self):
+        graph = export_summary([Node(0, 0, 0, {0, 1}), Node(1, 1, 1, {0}), Node(2, 1, 1, {1})], 'haplo')
+        response = self.client.get(reverse('gfa', args=[graph.pk]))
+        with tempfile.NamedTemporaryFile('wb', suffix='.gfa') as f:
+            f.write(b''.join(response.streaming_content))
+            f.flush()
+            copy = GFA.load_from_gfa(f.name)
+        self.assertEqual(copy.fingerprint(), GraphGenome.objects.get(pk=graph.pk).fingerprint)
+        self.assertEqual(copy.to_graph().pk, graph.pk)
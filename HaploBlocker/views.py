@@ -1,11 +1,18 @@
+from itertools import chain
+
 from django.shortcuts import render
 
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 from HaploBlocker.models import Edge
 
+STREAM_CHUNK_SIZE = 2000  # Edges per database round trip
+
 
 def index(request):
-    return HttpResponse("Index of Edges.\n" + str(Edge.objects.all()))
+    """Lists every Edge, one per line, streamed from a database cursor"""
+    edges = Edge.objects.all().iterator(chunk_size=STREAM_CHUNK_SIZE)
+    return StreamingHttpResponse(chain(["Index of Edges.\n"], (f"{edge}\n" for edge in edges)),
+                                 content_type='text/plain')
 
 # Create your views here.
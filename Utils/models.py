@@ -54,8 +54,11 @@ class CustomSaveQuerySet(models.QuerySet):
     def create(self, **kwargs):
         raise NotImplementedError("You must call the model save on this model!")
 
-    def bulk_create(self, objs, batch_size=None):
-        raise NotImplementedError("You must call the model save on this model!")
+    def bulk_create(self, objs, batch_size=None, force=False):
+        if force:  # caller is responsible for everything the model save would have done
+            return super(CustomSaveQuerySet, self).bulk_create(objs, batch_size=batch_size)
+        else:
+            raise NotImplementedError("You must call the model save on this model!")
 
     def get_or_create(self, defaults=None, **kwargs):
         raise NotImplementedError("You must call the model save on this model!")
@@ -83,6 +83,32 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# 'tiles' holds rendered graph windows, see Graph/cache.py.  Tile keys include the graph version
+# stored in the database, so invalidation reaches every process with any backend.  Local memory
+# is private to each process; use django.core.cache.backends.filebased.FileBasedCache when
+# several workers serve the same graphs so they also share the tiles.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'graph-tiles',
+        'TIMEOUT': None,  # tiles are invalidated by graph changes, not by age
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,  # least recently used tiles are evicted beyond this
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+# Read-only graph snapshots memory mapped by every worker process, see Graph/shared.py
+SHARED_GRAPH_DIR = os.path.join(BASE_DIR, 'shared_graphs')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
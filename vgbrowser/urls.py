@@ -19,4 +19,5 @@ from django.urls import path, include
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('haploblocker/', include('HaploBlocker.urls')),
+    path('graph/', include('Graph.urls')),
 ]
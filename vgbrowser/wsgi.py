@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vgbrowser.settings')
 
 application = get_wsgi_application()
+
+# Map published graph snapshots before a preforking server (e.g. gunicorn --preload) starts its
+# workers, so they all share one copy.  See Graph/shared.py.
+from Graph.shared import attach_all  # noqa: E402, needs the application to be set up
+attach_all()